@@ -0,0 +1,6 @@
+"""
+Shared building blocks for the EEG -> MIDI bridge scripts.
+
+The bridges in live_bridges/ and prerecorded_bridges/ stay runnable as plain
+scripts; they import the pieces they need from here.
+"""
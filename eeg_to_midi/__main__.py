@@ -0,0 +1,71 @@
+# __main__.py
+"""
+Entry point: python -m eeg_to_midi <command>
+
+    list                      MIDI ports and LSL streams from the last discovery
+    discover                  scan MIDI ports and LSL streams now (and cache them)
+    live play|modulation      run a live bridge
+    prerecorded single|multiband|combined
+                              run a prerecorded bridge
+    batch / replay / bench / trace
+                              see python -m eeg_to_midi <command> --help
+
+Only the selected command's modules are imported, so listing ports does not
+load numpy or pandas and a bridge does not wait for a discovery scan.
+"""
+
+import argparse
+import runpy
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+BRIDGES = {
+    'live': {'play': "live_bridges/bridge_live_play.py",
+             'modulation': "live_bridges/bridge_live_modulation.py"},
+    'prerecorded': {'single': "prerecorded_bridges/bridge_prerecorded.py",
+                    'multiband': "prerecorded_bridges/bridge_prerecorded__multiband.py",
+                    'combined': "prerecorded_bridges/bridge_prerecorded_combinedwaves.py"},
+}
+TOOLS = ("batch", "replay", "bench", "trace")     # eeg_to_midi.<tool>.main(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Tools have their own argument parsers; hand them the rest of the command line
+    if argv and argv[0] in TOOLS:
+        import importlib
+        return importlib.import_module(f"eeg_to_midi.{argv[0]}").main(argv[1:])
+
+    parser = argparse.ArgumentParser(prog="python -m eeg_to_midi", description="EEG -> MIDI bridges and tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="show MIDI ports and LSL streams (cached)")
+    listing.add_argument("--refresh", action="store_true", help="scan again instead of using the cache")
+    listing.add_argument("--wait", type=float, default=2.0, help="LSL scan time (s)")
+    discover = commands.add_parser("discover", help="scan MIDI ports and LSL streams and cache them")
+    discover.add_argument("--wait", type=float, default=2.0, help="LSL scan time (s)")
+    for kind, scripts in BRIDGES.items():
+        bridge = commands.add_parser(kind, help=f"run a {kind} bridge")
+        bridge.add_argument("bridge", choices=list(scripts))
+    for tool in TOOLS:
+        commands.add_parser(tool, help=f"see: python -m eeg_to_midi {tool} --help")
+    args = parser.parse_args(argv)
+
+    if args.command in ("list", "discover"):
+        from .discovery import discover as scan, format_discovery, load_cache
+
+        data = load_cache()
+        if args.command == "discover" or args.refresh or data is None:
+            data = scan(args.wait)
+        print(format_discovery(data))
+        return 0
+
+    # Bridges are plain scripts with their settings at the top; run them as such
+    script = REPO / BRIDGES[args.command][args.bridge]
+    sys.argv = [str(script)]
+    runpy.run_path(str(script), run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,201 @@
+# artifacts.py
+"""
+Artifact rejection before the spectral stage.
+
+Blinks and jaw clenches on the forehead electrodes (AF7/AF8 on a Muse) put
+huge broadband power into a window, which the mappings would otherwise turn
+into loud notes or a CC jump, and which drags any running baseline with it.
+An ArtifactDetector looks at whole blocks of windows at once, shaped
+(n_windows, n_samples, n_chan) as made by spectral.frame_windows (a single
+(n_samples, n_chan) window also works), and flags the bad ones so they can
+skip the spectral engine altogether.
+
+A detector is a list of checks. Each check maps the block (and the hop
+between its windows) to an (n_windows, n_chan) boolean array, so new ones
+are easy to add:
+
+    Threshold(peak_to_peak, 500)          fixed limit on a feature
+    RobustZ(line_length, 6)               far from this channel's recent median
+"""
+
+import numpy as np
+
+MAX_PTP_UV = 500.0      # peak-to-peak per channel (uV); well above EEG, typical of blinks/movement
+MAX_KURTOSIS = 8.0      # excess kurtosis; a blink is a single spike in an otherwise quiet window
+MAX_Z = 6.0             # robust z-score (median / MAD of recent windows) per channel
+HISTORY = 256           # windows of history for the robust z-scores
+
+
+# ---- per-window features, (n_windows, n_samples, n_chan) -> (n_windows, n_chan) ----
+def peak_to_peak(windows):
+    return np.ptp(windows, axis=-2)
+
+
+def excess_kurtosis(windows):
+    d = windows - np.mean(windows, axis=-2, keepdims=True)
+    d2 = np.square(d, dtype=np.float64)
+    m2 = np.mean(d2, axis=-2)
+    m4 = np.mean(np.square(d2), axis=-2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(m2 > 0, m4 / np.square(m2) - 3.0, 0.0)
+
+
+def line_length(windows):
+    """Mean absolute sample-to-sample change (large for muscle/EMG activity)."""
+    return np.mean(np.abs(np.diff(windows, axis=-2)), axis=-2)
+
+
+def variance(windows):
+    return np.var(windows, axis=-2, dtype=np.float64)
+
+
+# ---- checks ----
+class Threshold:
+    """Flags channels where feature(window) > limit."""
+
+    def __init__(self, feature, limit):
+        self.feature = feature
+        self.limit = limit
+
+    def __call__(self, windows, hop=None):
+        return self.feature(windows) > self.limit
+
+    def config(self):
+        return f"{self.feature.__name__}>{self.limit:g}"
+
+
+class RobustZ:
+    """
+    Flags channels whose feature is more than `max_z` robust standard
+    deviations (1.4826 * MAD) from that channel's median over the last
+    `history` windows plus the current block. With log=True the feature is
+    compared on a log scale, which suits powers and amplitudes. Nothing is
+    flagged until `min_history` windows have been seen.
+
+    When windows overlap (hop < window length, e.g. a live bridge checking
+    its latest window after every chunk), only about one window per window
+    length goes into the history, so it spans `history` windows of distinct
+    data rather than a few seconds of near-copies.
+    """
+
+    def __init__(self, feature, max_z=MAX_Z, history=HISTORY, min_history=16, log=True):
+        self.feature = feature
+        self.max_z = max_z
+        self.log = log
+        self.min_history = min_history
+        self._history = None    # (history, n_chan) ring, allocated on the first block
+        self._size = history
+        self._count = 0
+        self._pos = 0
+        self._advanced = 0      # samples since the last window that went into the history
+
+    def _push(self, values):
+        values = values[-self._size:]
+        n = len(values)
+        end = self._pos + n
+        if end <= self._size:
+            self._history[self._pos:end] = values
+        else:
+            split = self._size - self._pos
+            self._history[self._pos:] = values[:split]
+            self._history[:n - split] = values[split:]
+        self._pos = end % self._size
+        self._count = min(self._count + n, self._size)
+
+    def _spaced(self, values, hop, window):
+        # The windows that complete another `window` samples of new data
+        if not hop or hop >= window:
+            return values
+        advanced = self._advanced + hop * np.arange(1, len(values) + 1)
+        take = np.diff(advanced // window, prepend=0) > 0
+        self._advanced = int(advanced[-1] % window)
+        return values[take]
+
+    def __call__(self, windows, hop=None):
+        values = self.feature(windows).astype(np.float64)
+        if self.log:
+            values = np.log(np.maximum(values, 1e-12))
+        if self._history is None:
+            self._history = np.empty((self._size, values.shape[-1]))
+        reference = np.concatenate([self._history[:self._count], values])
+        pushed = self._spaced(values, hop, windows.shape[-2])
+        if len(pushed):
+            self._push(pushed)
+        if len(reference) < self.min_history:
+            return np.zeros(values.shape, dtype=bool)
+        median = np.median(reference, axis=0)
+        mad = np.median(np.abs(reference - median), axis=0)
+        return np.abs(values - median) > self.max_z * (1.4826 * mad + 1e-12)
+
+    def config(self):
+        return f"z({self.feature.__name__}{', log' if self.log else ''})>{self.max_z:g}/{self._size}"
+
+
+class ArtifactDetector:
+    """
+    Runs every check on a block of windows. A window is bad when any check
+    flags any of its channels; check_channels() gives the flags per channel
+    instead, for callers that mask only the flagged channels. Counts of
+    checked windows, bad windows and flagged channels are kept for reporting.
+
+    channels : names of the channels to check when windows come from a
+               recording with named channels (see features.iter_features);
+               None checks all of them
+    """
+
+    def __init__(self, checks, channels=None):
+        self.checks = list(checks)
+        self.channels = None if channels is None else list(channels)
+        self.windows = 0
+        self.rejected = 0
+        self.flagged = 0        # flagged (window, channel) pairs
+
+    def flag_channels(self, windows, hop=None):
+        """
+        (n_windows, n_chan) True where a channel of a window is flagged.
+        hop : samples between consecutive windows (for a single window: new
+              samples since the previous call); None = windows do not overlap
+        """
+        windows = np.asarray(windows)
+        if windows.ndim == 2:
+            windows = windows[None]
+        bad = np.zeros((windows.shape[0], windows.shape[-1]), dtype=bool)
+        for check in self.checks:
+            bad |= check(windows, hop)
+        return bad
+
+    def check_channels(self, windows, hop=None):
+        """flag_channels(), counted for summary()."""
+        bad = self.flag_channels(windows, hop)
+        self.windows += len(bad)
+        self.rejected += int(np.count_nonzero(bad.any(axis=-1)))
+        self.flagged += int(np.count_nonzero(bad))
+        return bad
+
+    def check(self, windows, hop=None):
+        """(n_windows,) True for bad windows."""
+        return self.check_channels(windows, hop).any(axis=-1)
+
+    def config(self):
+        """Description of the checks (part of the feature index key)."""
+        return {'checks': [check.config() for check in self.checks], 'channels': self.channels}
+
+    def summary(self):
+        return f"{self.rejected}/{self.windows} windows with artifacts ({self.flagged} channel windows flagged)"
+
+
+def default_detector(max_ptp=MAX_PTP_UV, max_kurtosis=MAX_KURTOSIS, max_z=MAX_Z, history=HISTORY, channels=None):
+    """
+    Amplitude, kurtosis, line-length and variance checks (None disables one).
+    The robust z-scores adapt to each channel's own level, so they need no
+    tuning per headset; the fixed limits catch what is obviously not EEG.
+    """
+    checks = []
+    if max_ptp is not None:
+        checks.append(Threshold(peak_to_peak, max_ptp))
+    if max_kurtosis is not None:
+        checks.append(Threshold(excess_kurtosis, max_kurtosis))
+    if max_z is not None:
+        checks.append(RobustZ(line_length, max_z, history))
+        checks.append(RobustZ(variance, max_z, history))
+    return ArtifactDetector(checks, channels)
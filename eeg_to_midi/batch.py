@@ -0,0 +1,243 @@
+# batch.py
+"""
+Render whole study folders of prerecorded sessions to MIDI in parallel.
+
+    python -m eeg_to_midi.batch "study/*.xdf" --out renders/ --config mapping.json --jobs 32
+
+Each recording is handled by one worker process: its windows are streamed
+from disk (see recording.py), reduced to one feature row per window, mapped
+to notes and written to <out>/<name>.mid, where <name> is the recording's
+path relative to the folder all inputs share (sub01/session.xdf ->
+<out>/sub01/session.mid). Only the per-window features and the note events
+are held in memory, so memory use per worker stays small whatever the file
+length. A summary table (CSV) lists every file.
+
+The mapping config is a JSON object. "mode" picks which prerecorded bridge
+to reproduce ("alpha", "multiband" or "combined") and any other key
+overrides that mode's defaults below.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+from .mapping import map_power_to_notes, map_intensity, dynamic_window
+from .normalize import OnlineNormalizer
+from .artifacts import default_detector
+from .features import load_features
+from .recording import open_recording, BLOCK_SAMPLES
+from .render import note_events, write_midi_file
+from .spectral import EEG_BANDS
+
+# Defaults mirror the settings of the corresponding prerecorded bridge scripts
+PRESETS = {
+    'alpha': {                          # bridge_prerecorded.py
+        'channels': ["AF8"], 'window_sec': 1.0, 'bands': {'alpha': [8, 12]},
+        'note_low': 48, 'note_high': 72, 'vel_min': 40, 'vel_max': 80,
+    },
+    'multiband': {                      # bridge_prerecorded__multiband.py
+        'channels': ["AF7"], 'window_sec': 0.25, 'bands': EEG_BANDS, 'band_offset': 2,
+        'note_low': 48, 'note_high': 72, 'vel_min': 20, 'vel_max': 80,
+    },
+    'combined': {                       # bridge_prerecorded_combinedwaves.py
+        'channels': ["AF7", "AF8", "TP9", "TP10"], 'window_sec': 1.0,
+        'note_low': 48, 'note_high': 84, 'vel_min': 40, 'vel_max': 100,
+        'sensitivity': 5.0, 'tempo_scale': 0.6,
+        'baseline': "online", 'baseline_forgetting': None, 'baseline_warmup': 10,
+        'artifacts': True, 'artifact_max_ptp': 500.0,
+    },
+}
+# Shared by every mode
+COMMON = {'fs': 256, 'hop_sec': None, 'block_samples': BLOCK_SAMPLES, 'feature_index': True, 'artifacts': False,
+          'artifact_max_ptp': 500.0}
+
+
+def load_config(path=None, **overrides):
+    """Mapping config: preset for cfg['mode'] + file contents + overrides."""
+    cfg = {}
+    if path:
+        with open(path) as f:
+            cfg.update(json.load(f))
+    cfg.update({k: v for k, v in overrides.items() if v is not None})
+    mode = cfg.get('mode', 'alpha')
+    if mode not in PRESETS:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {list(PRESETS)}")
+    return {'mode': mode, **COMMON, **PRESETS[mode], **cfg}
+
+
+# ---- stage 1: per-window features ----
+def window_features(recording, cfg):
+    """
+    (starts, features) for a recording. features is (n_windows, n_bands)
+    band power for alpha/multiband, or (n_windows, 1) mean power over all
+    channels for combined. Read from the recording's feature index when
+    cfg['feature_index'] is set and one exists for this window/band config.
+    With cfg['artifacts'], windows flagged as artifacts are left out.
+    """
+    window_size = int(recording.fs * cfg['window_sec'])
+    hop = max(1, int(round(recording.fs * cfg['hop_sec']))) if cfg.get('hop_sec') else window_size
+    # combined only uses the mean square, so it skips the spectral engine
+    bands = {} if cfg['mode'] == 'combined' else {k: tuple(v) for k, v in cfg.get('bands', EEG_BANDS).items()}
+    artifacts = (default_detector(max_ptp=cfg['artifact_max_ptp'], channels=cfg['channels'])
+                 if cfg['artifacts'] else None)
+    channels = cfg['channels'] if cfg['mode'] == 'combined' else cfg['channels'][:1]
+    features = load_features(recording, window_size, bands, cfg['block_samples'], cfg['feature_index'], hop,
+                             artifacts, channels).clean()
+    if cfg['mode'] == 'combined':
+        return features.starts, features.power(cfg['channels'])[:, None]
+    return features.starts, features.bands(cfg['channels'][0])
+
+
+def _hop_sec(cfg):
+    # Seconds between windows (and notes); the window length unless set
+    return cfg.get('hop_sec') or cfg['window_sec']
+
+
+# ---- stage 2: features -> note events ----
+def map_features(starts, features, fs, cfg):
+    """Note events for one recording, as (time_sec, message) pairs."""
+    onsets = starts / fs
+    if cfg['mode'] == 'combined':
+        powers = features[:, 0]
+        normalizer = OnlineNormalizer(cfg['baseline_forgetting'], cfg['baseline_warmup'])
+        if cfg['baseline'] == 'two-pass':
+            zs = normalizer.fit(powers).zscore(powers)
+        else:
+            zs = normalizer.update_many(powers)
+        notes, velocities, scaled = map_intensity(zs, cfg['sensitivity'], cfg['note_low'], cfg['note_high'],
+                                                  cfg['vel_min'], cfg['vel_max'])
+        durations = dynamic_window(scaled, _hop_sec(cfg), cfg['tempo_scale']) / 2
+        return note_events(onsets, durations, notes, velocities)
+
+    notes, velocities = map_power_to_notes(features, cfg['note_low'], cfg['note_high'],
+                                           cfg['vel_min'], cfg['vel_max'])
+    notes = notes + cfg.get('band_offset', 0) * np.arange(features.shape[1])
+    return note_events(onsets[:, None], _hop_sec(cfg) / 2, notes, velocities)
+
+
+def render_file(path, out_path, cfg):
+    """Render one recording to out_path; returns its summary row. Runs inside a worker."""
+    t0 = time.perf_counter()
+    row = {'file': str(path), 'midi': '', 'fs': '', 'windows': 0, 'notes': 0,
+           'duration_sec': 0.0, 'elapsed_sec': 0.0, 'error': ''}
+    try:
+        recording = open_recording(path, fs=cfg['fs'])
+        starts, features = window_features(recording, cfg)
+        events = map_features(starts, features, recording.fs, cfg)
+        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+        write_midi_file(events, out_path)
+        row.update(midi=str(out_path), fs=recording.fs, windows=len(starts),
+                   notes=len(events) // 2, duration_sec=round(events[-1][0], 3) if events else 0.0)
+    except Exception as e:     # one bad file must not stop the whole study
+        row['error'] = f"{type(e).__name__}: {e}"
+    row['elapsed_sec'] = round(time.perf_counter() - t0, 3)
+    return row
+
+
+def expand_inputs(inputs, exclude=()):
+    """
+    Recordings named by files, directories (all .csv/.xdf inside) or glob
+    patterns, except files in or under the `exclude` paths (the output
+    folder and summary, which may sit inside a study folder).
+    """
+    excluded = [os.path.abspath(e) for e in exclude]
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += sorted(p for p in Path(item).rglob("*") if p.suffix.lower() in (".csv", ".xdf"))
+        else:
+            paths += sorted(Path(p) for p in glob.glob(item, recursive=True))
+    # The same file named twice (e.g. "a.xdf" and "./study/../a.xdf") is rendered once
+    unique = {}
+    for p in paths:
+        full = os.path.abspath(p)
+        if not any(full == e or full.startswith(e + os.sep) for e in excluded):
+            unique.setdefault(full, p)
+    return list(unique.values())
+
+
+def output_paths(paths, out_dir):
+    """
+    .mid path for each recording: its path relative to the folder all of
+    them share, so sub01/session.xdf and sub02/session.xdf do not overwrite
+    each other. Recordings that differ only in extension keep it
+    (rec.csv.mid, rec.xdf.mid).
+    """
+    absolute = [Path(os.path.abspath(p)) for p in paths]
+    root = Path(os.path.commonpath([p.parent for p in absolute]))
+    relative = [p.relative_to(root) for p in absolute]
+    # compared case-insensitively, as on Windows and macOS file systems
+    stems = Counter(str(r.with_suffix('')).lower() for r in relative)
+    outputs = []
+    for r in relative:
+        name = r.with_suffix(".mid") if stems[str(r.with_suffix('')).lower()] == 1 else r.with_name(r.name + ".mid")
+        outputs.append(Path(out_dir) / name)
+    return outputs
+
+
+def run_batch(paths, out_dir, cfg, jobs=None, files_per_worker=25):
+    """Render every recording across a process pool; returns summary rows in input order."""
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = output_paths(paths, out_dir) if paths else []
+    jobs = jobs or os.cpu_count()
+    rows = [None] * len(paths)
+    # Workers are recycled every few files so memory is handed back to the OS,
+    # without paying interpreter start-up and imports for every single file
+    with Pool(processes=jobs, maxtasksperchild=files_per_worker) as pool:
+        tasks = [(i, p, out, cfg) for i, (p, out) in enumerate(zip(paths, outputs))]
+        for done, (i, row) in enumerate(pool.imap_unordered(_render_task, tasks), 1):
+            rows[i] = row
+            status = row['error'] or f"{row['notes']} notes in {row['elapsed_sec']:.2f}s"
+            print(f"[{done}/{len(paths)}] {row['file']}: {status}")
+    return rows
+
+
+def _render_task(task):
+    i, path, out_path, cfg = task
+    return i, render_file(path, out_path, cfg)
+
+
+def write_summary(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render prerecorded EEG sessions to MIDI files in parallel.")
+    parser.add_argument("inputs", nargs="+", help="recordings, directories or glob patterns (.csv/.xdf)")
+    parser.add_argument("--out", default="renders", help="output directory for .mid files")
+    parser.add_argument("--config", help="JSON mapping config (see PRESETS)")
+    parser.add_argument("--mode", choices=list(PRESETS), help="override the config's mode")
+    parser.add_argument("--jobs", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--files-per-worker", type=int, default=25,
+                        help="recycle each worker process after this many files")
+    parser.add_argument("--summary", help="summary CSV path (default: <out>/summary.csv)")
+    args = parser.parse_args(argv)
+
+    cfg = load_config(args.config, mode=args.mode)
+    summary = args.summary or os.path.join(args.out, "summary.csv")
+    paths = expand_inputs(args.inputs, exclude=[args.out, summary])
+    if not paths:
+        parser.error("no recordings found")
+    print(f"Rendering {len(paths)} recordings with mode '{cfg['mode']}' on {args.jobs or os.cpu_count()} workers")
+
+    t0 = time.perf_counter()
+    rows = run_batch(paths, args.out, cfg, args.jobs, args.files_per_worker)
+    write_summary(rows, summary)
+    failed = sum(bool(r['error']) for r in rows)
+    print(f"Done: {len(rows) - failed} rendered, {failed} failed in {time.perf_counter() - t0:.1f}s -> {summary}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
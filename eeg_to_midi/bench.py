@@ -0,0 +1,194 @@
+# bench.py
+"""
+Benchmarks for the EEG -> MIDI pipeline on synthetic data.
+
+    python -m eeg_to_midi.bench --out bench.json
+    python -m eeg_to_midi.bench --out new.json --compare bench.json
+
+Every stage of the live path (ring buffer, spectral, mapping, send), the
+whole window-to-event path and the prerecorded batch analysis are timed for
+each combination of window size, channel count and band set. MIDI goes to a
+FakeMidiPort, so no loopMIDI or headset is needed. Results are written as
+JSON together with the environment, and --compare flags stages that got
+slower than a previous run.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import mido
+import numpy as np
+
+from .mapping import HysteresisGate, map_power_to_notes
+from .midi import FakeMidiPort
+from .ringbuffer import RingBuffer
+from .spectral import BandPowerEngine, SlidingBandPower, EEG_BANDS, frame_windows
+from .synthetic import synthetic_eeg
+
+BAND_SETS = {'alpha': {'alpha': (8, 12)}, 'all': EEG_BANDS}
+
+
+def time_it(fn, min_time=0.2, min_iters=20):
+    """Call fn repeatedly for at least min_time seconds; per-call stats in microseconds."""
+    fn()    # warm-up (caches, lazily built engines)
+    durations = []
+    t_end = time.perf_counter() + min_time
+    while len(durations) < min_iters or time.perf_counter() < t_end:
+        t0 = time.perf_counter_ns()
+        fn()
+        durations.append(time.perf_counter_ns() - t0)
+    d = np.asarray(durations) / 1e3
+    return {'median_us': float(np.median(d)), 'p95_us': float(np.percentile(d, 95)),
+            'min_us': float(d.min()), 'iterations': len(d)}
+
+
+def bench_case(fs, window_sec, n_chan, band_set, hop, min_time):
+    """Time every stage for one configuration; returns {stage: stats}."""
+    bands = BAND_SETS[band_set]
+    window_samples = int(fs * window_sec)
+    data = synthetic_eeg(max(60.0, 4 * window_sec), fs=fs, n_chan=n_chan, seed=1).astype(np.float64)
+    chunks = [data[i:i + hop] for i in range(0, len(data) - hop, hop)]
+    cursor = itertools.cycle(chunks)
+
+    buffer = RingBuffer(window_samples, n_chan)
+    buffer.extend(data[:window_samples])
+    engine = BandPowerEngine(fs, window_samples, bands, reduce="trapz")
+    sliding = SlidingBandPower(fs, window_samples, bands, n_chan, reduce="trapz")
+    sliding.update(data[:window_samples])
+    gate = HysteresisGate(n_chan, 0.4, 0.3, 1.0)
+    port = FakeMidiPort()
+    notes_base = 60 + np.arange(n_chan)
+    powers = engine.compute(buffer.latest())
+
+    def mapping():
+        p = powers[0]
+        norm = (p - p.min()) / max(1e-9, np.ptp(p))
+        on, off = gate.update(norm, time.perf_counter())
+        return norm, on, off
+
+    def send():
+        for ch in range(n_chan):
+            port.send(mido.Message('note_on', note=int(notes_base[ch]) % 128, velocity=64))
+
+    def window_to_event():
+        buffer.extend(next(cursor))
+        p = engine.compute(buffer.latest())[0]
+        norm = (p - p.min()) / max(1e-9, np.ptp(p))
+        on, off = gate.update(norm, time.perf_counter())
+        for ch in np.flatnonzero(on | off):
+            port.send(mido.Message('note_on' if on[ch] else 'note_off',
+                                   note=int(notes_base[ch]) % 128, velocity=64))
+
+    def window_to_event_sliding():
+        p = sliding.update(next(cursor))[0]
+        norm = (p - p.min()) / max(1e-9, np.ptp(p))
+        on, off = gate.update(norm, time.perf_counter())
+        for ch in np.flatnonzero(on | off):
+            port.send(mido.Message('note_on' if on[ch] else 'note_off',
+                                   note=int(notes_base[ch]) % 128, velocity=64))
+
+    frames = frame_windows(data, window_samples)
+    batch_engine = BandPowerEngine(fs, window_samples, bands)
+
+    def prerecorded_batch():
+        bp = batch_engine.compute(frames, axis=1)
+        return map_power_to_notes(bp, 48, 72, 40, 80)
+
+    stages = {
+        'ring_buffer': lambda: (buffer.extend(next(cursor)), buffer.latest()),
+        'spectral_welch': lambda: engine.compute(buffer.latest()),
+        'spectral_sliding': lambda: sliding.update(next(cursor)),
+        'mapping': mapping,
+        'send': send,
+        'window_to_event': window_to_event,
+        'window_to_event_sliding': window_to_event_sliding,
+        'prerecorded_batch': prerecorded_batch,
+    }
+    results = {name: time_it(fn, min_time) for name, fn in stages.items()}
+    # Per-window cost of the batch analysis is the number that scales with recording length
+    results['prerecorded_batch']['windows'] = len(frames)
+    results['prerecorded_batch']['per_window_us'] = results['prerecorded_batch']['median_us'] / max(1, len(frames))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent).stdout.strip()
+    except OSError:
+        commit = ""
+    return {'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'platform': platform.platform()}
+
+
+def run(fs=256, windows=(0.25, 0.5, 1.0), channels=(4, 16, 64), band_sets=("alpha", "all"),
+        hop=12, min_time=0.2, echo=True):
+    cases = []
+    for window_sec, n_chan, band_set in itertools.product(windows, channels, band_sets):
+        params = {'fs': fs, 'window_sec': window_sec, 'n_chan': n_chan, 'bands': band_set, 'hop': hop}
+        stages = bench_case(fs, window_sec, n_chan, band_set, hop, min_time)
+        cases.append({'params': params, 'stages': stages})
+        if echo:
+            summary = " ".join(f"{k}={v['median_us']:.0f}us" for k, v in stages.items())
+            print(f"win={window_sec}s ch={n_chan} bands={band_set}: {summary}")
+    return {'environment': environment(), 'cases': cases}
+
+
+def _key(case):
+    p = case['params']
+    return p['fs'], p['window_sec'], p['n_chan'], p['bands'], p['hop']
+
+
+def compare(new, old, threshold=1.2):
+    """Print stages whose median got slower than `threshold` x the old run; returns their count."""
+    old_cases = {_key(c): c for c in old['cases']}
+    regressions = 0
+    for case in new['cases']:
+        before = old_cases.get(_key(case))
+        if before is None:
+            continue
+        for stage, stats in case['stages'].items():
+            if stage not in before['stages']:
+                continue
+            ratio = stats['median_us'] / max(1e-9, before['stages'][stage]['median_us'])
+            if ratio > threshold:
+                regressions += 1
+                print(f"REGRESSION {stage} {case['params']}: "
+                      f"{before['stages'][stage]['median_us']:.1f}us -> {stats['median_us']:.1f}us ({ratio:.2f}x)")
+    print(f"{regressions} regressions (threshold {threshold:.2f}x)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EEG -> MIDI pipeline on synthetic EEG.")
+    parser.add_argument("--fs", type=float, default=256)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0.25, 0.5, 1.0], help="window lengths (s)")
+    parser.add_argument("--channels", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--bands", nargs="+", default=["alpha", "all"], choices=list(BAND_SETS))
+    parser.add_argument("--hop", type=int, default=12, help="samples per incoming chunk")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed stage")
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--compare", help="previous results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.fs, args.windows, args.channels, args.bands, args.hop, args.min_time)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        return 1 if compare(results, old, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+# clock.py
+"""
+Dejittered sample times for LSL streams.
+
+LSL timestamps are taken when a chunk reaches the network layer, so they
+arrive in bursts: a Muse chunk of 12 samples may carry 12 nearly equal
+stamps, then a jump. Driving MIDI from them makes the output as bursty as
+the Bluetooth link. A stream's true sample times, however, lie on a straight
+line (t = intercept + sample_index * period), so Dejitter fits that line to
+the timestamps by exponentially weighted least squares and returns each
+sample's position on it. The fit follows slow drift between the device and
+local clocks (the slope is estimated, not taken from the nominal rate) while
+a single late chunk barely moves it.
+
+Chunks stamped well after the line are either stalled (the stream catches
+up afterwards) or follow lost samples (it stays late by the same amount).
+They are kept out of the fit until that is clear: only lateness that holds
+steady over LATE_CHUNKS chunks, and at least GAP_SEC of samples, moves the
+sample index past the samples that were lost.
+
+Together with LSL's time_correction() the result is on the local_clock()
+timeline, which is monotonic, so a live bridge can schedule every MIDI event
+at a fixed latency after the sample it was computed from.
+"""
+
+import numpy as np
+
+HALFLIFE_SEC = 30.0     # how quickly old samples stop counting in the fit
+WARMUP_SEC = 2.0        # before this much data, the slope is the nominal rate
+GAP_SEC = 0.1           # chunks later than the fit by more than this may follow dropped samples
+LATE_CHUNKS = 3         # ...and do once this many chunks in a row are late by a steady amount
+
+
+class Dejitter:
+    """
+    Linear fit of timestamp against sample index for one stream.
+
+    fs           : nominal sample rate (0 = irregular stream, timestamps
+                   are passed through unchanged)
+    halflife_sec : weight of a sample halves every this many seconds
+    """
+
+    def __init__(self, fs, halflife_sec=HALFLIFE_SEC, warmup_sec=WARMUP_SEC, gap_sec=GAP_SEC,
+                 late_chunks=LATE_CHUNKS):
+        self.fs = float(fs)
+        self.gap_sec = gap_sec
+        self.late_chunks = late_chunks
+        self.decay = 0.5 ** (1.0 / max(1.0, halflife_sec * self.fs)) if self.fs > 0 else 0.0
+        self.warmup = warmup_sec * self.fs
+        self.n_seen = 0
+        self._next_index = None     # sample index of the next sample
+        self._origin = None         # (index, timestamp) the sums are taken relative to
+        self._late = None           # (first lateness, chunks, samples) of the current run of late chunks
+        # exponentially weighted sums of 1, x, y, x*x, x*y (x = index, y = timestamp)
+        self._sums = np.zeros(5)
+
+    def _indices(self, timestamps):
+        # Consecutive indices within a chunk, and whether it goes into the
+        # fit. Smaller offsets from the line are jitter and are left to the
+        # fit. A chunk well after it is held out; once the run of late chunks
+        # shows samples were lost (it stays late instead of catching up), the
+        # index skips ahead over them so the line stays put.
+        n = len(timestamps)
+        if self._next_index is None:
+            return np.arange(n), True
+        index = self._next_index + np.arange(n)
+        late = np.mean(timestamps - self._origin[1] - self._line(index - self._origin[0]))
+        if late <= self.gap_sec:
+            self._late = None
+            return index, True
+        first, chunks, samples = self._late or (late, 0, 0)
+        self._late = (first, chunks + 1, samples + n)
+        if (chunks + 1 >= self.late_chunks and samples + n >= self.gap_sec * self.fs
+                and late > first - self.gap_sec / 2):
+            self._late = None
+            return index + int(round(late * self.fs)), True
+        return index, False
+
+    def update(self, timestamps):
+        """Dejittered times of a chunk's samples (same clock as `timestamps`)."""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(timestamps)
+        if n == 0 or self.fs <= 0:
+            return timestamps
+        index, fit = self._indices(timestamps)
+        if self._origin is None:
+            self._origin = (index[0], timestamps[0])
+        x = (index - self._origin[0]).astype(np.float64)
+        if fit:
+            # Decay the old sums by n samples, then add the chunk with per-sample weights
+            y = timestamps - self._origin[1]
+            w = self.decay ** np.arange(n - 1, -1, -1)
+            self._sums *= self.decay ** n
+            self._sums += [w.sum(), w @ x, w @ y, w @ (x * x), w @ (x * y)]
+        self._next_index = index[-1] + 1
+        self.n_seen += n
+        return self._origin[1] + self._line(x)
+
+    def _line(self, x):
+        s_w, s_x, s_y, s_xx, s_xy = self._sums
+        mean_x, mean_y = s_x / s_w, s_y / s_w
+        var_x = s_xx / s_w - mean_x * mean_x
+        if self.n_seen < self.warmup or var_x <= 0:
+            slope = 1.0 / self.fs
+        else:
+            slope = (s_xy / s_w - mean_x * mean_y) / var_x
+        return mean_y + slope * (x - mean_x)
+
+    @property
+    def rate(self):
+        """Effective sample rate of the fit (Hz)."""
+        s_w, s_x, s_y, s_xx, s_xy = self._sums
+        if s_w == 0 or self.n_seen < self.warmup:
+            return self.fs
+        mean_x, mean_y = s_x / s_w, s_y / s_w
+        var_x = s_xx / s_w - mean_x * mean_x
+        cov = s_xy / s_w - mean_x * mean_y
+        return var_x / cov if cov > 0 else self.fs
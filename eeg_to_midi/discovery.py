@@ -0,0 +1,140 @@
+# discovery.py
+"""
+Cached discovery of MIDI ports and LSL streams.
+
+Scanning the network for LSL streams means waiting out a resolve timeout, so
+the bridges no longer do it on every start. `python -m eeg_to_midi discover`
+(or any full scan) writes what it found to a small JSON file. A bridge that
+asks for streams by name then resolves exactly those by source id, which
+returns as soon as each one answers. A bridge that wants every stream of a
+type does a short scan instead, so a headset added since the cache was
+written still joins, and the cache tells it whether the short scan heard
+every stream it knows of. Either falls back to a full scan when a cached
+stream does not answer.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+SCAN_SEC = 0.5      # short scan used when every stream of a type is wanted
+
+CACHE_PATH = Path(os.environ.get("EEG_TO_MIDI_CACHE", Path.home() / ".cache" / "eeg_to_midi")) / "discovery.json"
+
+
+def load_cache(path=CACHE_PATH):
+    """The last discovery result, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _update_cache(path=CACHE_PATH, **fields):
+    data = load_cache(path) or {}
+    data.update(fields, time=time.time())
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, path)
+    except OSError:
+        pass    # the cache is only an optimisation
+    return data
+
+
+def _stream_entry(info):
+    return {'name': info.name(), 'type': info.type(), 'channels': info.channel_count(),
+            'fs': info.nominal_srate(), 'source_id': info.source_id(), 'hostname': info.hostname()}
+
+
+def scan_midi():
+    """Scan MIDI ports now and cache the result."""
+    import mido
+
+    try:
+        return _update_cache(midi_outputs=mido.get_output_names(), midi_inputs=mido.get_input_names(),
+                             midi_error=None)
+    except (ImportError, OSError) as e:    # no MIDI backend (e.g. python-rtmidi missing)
+        return _update_cache(midi_outputs=[], midi_inputs=[], midi_error=str(e))
+
+
+def scan_lsl(wait_time=2.0):
+    """Scan the network for LSL streams now; returns their StreamInfos and caches a summary."""
+    from pylsl import resolve_streams
+
+    infos = resolve_streams(wait_time=wait_time)
+    _update_cache(lsl_streams=[_stream_entry(s) for s in infos])
+    return infos
+
+
+def discover(wait_time=2.0):
+    """Full scan of MIDI ports and LSL streams; returns the refreshed cache."""
+    scan_midi()
+    scan_lsl(wait_time)
+    return load_cache()
+
+
+def _stream_key(source_id, name):
+    return source_id or name
+
+
+def resolve_cached(stream_type="EEG", names=None, timeout=1.0, scan_sec=SCAN_SEC):
+    """
+    StreamInfos for the streams of `stream_type` with the help of the cache.
+
+    With `names`, the cached streams of those names are resolved by source
+    id. Without, every stream of the type is wanted: a `scan_sec` scan finds
+    them, including new ones (which are reported). None when there is
+    nothing cached or a cached stream does not answer, in which case the
+    caller does a full scan.
+    """
+    from pylsl import resolve_byprop
+
+    entries = [e for e in (load_cache() or {}).get('lsl_streams', [])
+               if e['type'] == stream_type and (not names or e['name'] in names)]
+    if not entries or (names and {e['name'] for e in entries} != set(names)):
+        return None
+    if not names:
+        return _scan_known(stream_type, entries, scan_sec)
+    infos = []
+    for e in entries:
+        prop, value = ('source_id', e['source_id']) if e['source_id'] else ('name', e['name'])
+        found = [s for s in resolve_byprop(prop, value, minimum=1, timeout=timeout) if s.type() == stream_type]
+        if not found:
+            return None
+        infos.append(found[0])
+    return infos
+
+
+def _scan_known(stream_type, entries, scan_sec):
+    # Short scan, checked against the cached streams
+    infos = [s for s in scan_lsl(wait_time=scan_sec) if s.type() == stream_type]
+    known = {_stream_key(e['source_id'], e['name']) for e in entries}
+    seen = {_stream_key(s.source_id(), s.name()) for s in infos}
+    new = sorted(s.name() for s in infos if _stream_key(s.source_id(), s.name()) not in known)
+    if new:
+        print(f"New {stream_type} streams since the last discovery: {', '.join(new)}")
+    if known - seen:
+        return None     # a known stream did not answer in time (or is gone)
+    return infos
+
+
+def format_discovery(data):
+    """Printable listing of a discovery result."""
+    if not data:
+        return "Nothing discovered yet (run: python -m eeg_to_midi discover)."
+    lines = [f"Discovered {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['time']))}"]
+    if data.get('midi_error'):
+        lines.append(f"MIDI backend unavailable: {data['midi_error']}")
+    lines.append("MIDI output ports:")
+    lines += [f"   {name}" for name in data.get('midi_outputs', [])] or ["   (none)"]
+    lines.append("MIDI input ports:")
+    lines += [f"   {name}" for name in data.get('midi_inputs', [])] or ["   (none)"]
+    lines.append("LSL streams:")
+    lines += [f"   Name: {s['name']}  |  Type: {s['type']}  |  Channels: {s['channels']}  |  "
+              f"{s['fs']:g} Hz  |  {s['hostname']}" for s in data.get('lsl_streams', [])] or ["   (none)"]
+    return "\n".join(lines)
@@ -0,0 +1,264 @@
+# features.py
+"""
+Per-window feature index for prerecorded sessions.
+
+The spectral pass is the slow part of a prerecorded run, and it does not
+depend on the note/velocity mapping. So every window's band power (per
+channel, per band) and mean-square power (per channel) are computed once and
+stored next to the recording:
+
+    <file>.features/<key>.npz
+
+where the key hashes the recording's samples together with the window, hop
+and band config. Changing NOTE_RANGE_*, SENSITIVITY, TEMPO_SCALE or the
+channel then only re-runs the mapping; changing the window or bands builds a
+new index. With no bands (bands={}, as for the combined mapping, which only
+uses the mean square) the spectral engine is skipped altogether.
+
+Only the channels a mapping asks for are read, and the sample hash covers
+just those channels (and their names), so each channel selection has its own
+index. The hash is taken while the first pass streams the recording, so the
+first notes are not held up by reading the whole file, and is remembered by
+size/mtime in <file>.features/hash.json, so an unchanged file is looked up
+directly.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .recording import BLOCK_SAMPLES, iter_window_batches, match_channels
+from .spectral import BandPowerEngine, EEG_BANDS
+
+INDEX_VERSION = 4   # 2: the last complete window is included, 3: artifact flags, 4: keyed on samples
+
+
+class Features:
+    """
+    Features of every window of one recording.
+
+    starts      : (n_windows,) start sample of each window
+    band_power  : (n_windows, n_bands, n_chan) mean PSD inside each band
+                  (NaN for windows rejected as artifacts)
+    mean_square : (n_windows, n_chan) mean squared amplitude
+    bad         : (n_windows,) True for windows rejected as artifacts
+    """
+
+    def __init__(self, starts, band_power, mean_square, band_names, channels, fs, window_size, hop, bad=None):
+        self.starts = starts
+        self.band_power = band_power
+        self.mean_square = mean_square
+        self.bad = np.zeros(len(starts), dtype=bool) if bad is None else bad
+        self.band_names = list(band_names)
+        self.channels = list(channels)
+        self.fs = float(fs)
+        self.window_size = int(window_size)
+        self.hop = int(hop)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def bands(self, channel):
+        """(n_windows, n_bands) band powers of one channel."""
+        return self.band_power[:, :, match_channels([channel], self.channels)[0]]
+
+    def power(self, channels):
+        """(n_windows,) mean squared amplitude over the given channels."""
+        return np.mean(self.mean_square[:, match_channels(channels, self.channels)], axis=1)
+
+    def clean(self):
+        """The same Features without the windows rejected as artifacts."""
+        if not self.bad.any():
+            return self
+        keep = ~self.bad
+        return Features(self.starts[keep], self.band_power[keep], self.mean_square[keep], self.band_names,
+                        self.channels, self.fs, self.window_size, self.hop, self.bad[keep])
+
+
+# ---- index files ----
+def index_dir(path):
+    path = Path(path)
+    return path.with_name(path.name + ".features")
+
+
+def _file_stamp(path):
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_memo(path):
+    try:
+        with open(index_dir(path) / "hash.json") as f:
+            memo = json.load(f)
+        if memo['stamp'] == _file_stamp(path):
+            return memo
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def known_hash(path, channels):
+    """Sample hash of these channels of an unchanged recording from hash.json, or None."""
+    memo = _read_memo(path)
+    return None if memo is None else memo.get('hashes', {}).get(json.dumps(list(channels)))
+
+
+def remember_hash(path, stamp, digest, channels):
+    memo = _read_memo(path)
+    hashes = memo['hashes'] if memo is not None and memo['stamp'] == stamp else {}
+    hashes[json.dumps(list(channels))] = digest
+    memo_path = index_dir(path) / "hash.json"
+    try:
+        memo_path.parent.mkdir(exist_ok=True)
+        with open(memo_path, 'w') as f:
+            json.dump({'stamp': stamp, 'hashes': hashes}, f)
+    except OSError:
+        pass
+
+
+def _hashed(blocks, h):
+    # Pass blocks through, feeding every sample into the hash
+    for block in blocks:
+        h.update(np.ascontiguousarray(block, dtype=np.float32).data)
+        yield block
+
+
+def index_key(digest, fs, window_size, hop, bands, artifacts=None):
+    """Index file name for a recording's sample hash and analysis config."""
+    config = {'version': INDEX_VERSION, 'samples': digest, 'fs': float(fs), 'window': int(window_size),
+              'hop': int(hop), 'bands': {name: list(map(float, band)) for name, band in bands.items()},
+              'artifacts': artifacts}
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=12).hexdigest()
+
+
+def load_index(path, key):
+    """Features stored under `key`, or None."""
+    try:
+        with np.load(index_dir(path) / f"{key}.npz") as z:
+            meta = json.loads(str(z['meta']))
+            return Features(z['starts'], z['band_power'], z['mean_square'], bad=z['bad'], **meta)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_index(path, key, features):
+    out_dir = index_dir(path)
+    meta = {'band_names': features.band_names, 'channels': features.channels, 'fs': features.fs,
+            'window_size': features.window_size, 'hop': features.hop}
+    try:
+        out_dir.mkdir(exist_ok=True)
+        tmp = out_dir / f"{key}.tmp.npz"
+        np.savez(tmp, starts=features.starts, band_power=features.band_power,
+                 mean_square=features.mean_square, bad=features.bad, meta=json.dumps(meta))
+        os.replace(tmp, out_dir / f"{key}.npz")
+    except OSError:
+        pass    # read-only location: the run still works, it just is not cached
+
+
+# ---- extraction ----
+def iter_features(recording, window_size, bands=EEG_BANDS, block_samples=BLOCK_SAMPLES, use_index=True,
+                  hop=None, artifacts=None, channels=None):
+    """
+    Yield Features for consecutive batches of windows of the given channels
+    (default: every channel), starting every `hop` samples (default:
+    window_size, no overlap). Other channels are not read.
+
+    With an ArtifactDetector (see artifacts.py), each batch of windows is
+    checked first and the bad ones skip the spectral engine; they are
+    flagged in Features.bad. Channels it checks are read (and included in
+    the Features) even if not asked for.
+
+    bands={} skips the spectral engine (band_power then has no bands), for
+    mappings that only use the mean square.
+
+    With an index for this config, it is yielded as a single batch without
+    touching the samples. Otherwise the recording is streamed block by block
+    (so playback can start right away) and the index is written once the
+    last block is done; a run stopped early writes nothing.
+    """
+    bands = {'band': bands} if isinstance(bands, tuple) else bands
+    hop = int(hop or window_size)
+    # The robust z-scores depend on how windows are batched, so the block size is part of the key
+    check = None if artifacts is None else {**artifacts.config(), 'block': int(block_samples)}
+    config = (recording.fs, window_size, hop, bands, check)
+    channels = _read_channels(recording, channels, artifacts)
+    digest = known_hash(recording.path, channels) if use_index else None
+    if digest is not None:
+        cached = load_index(recording.path, index_key(digest, *config))
+        if cached is not None:
+            yield cached
+            return
+
+    band_names = list(bands)
+    engine = BandPowerEngine(recording.fs, window_size, bands) if bands else None
+    checked = slice(None)
+    if artifacts is not None and artifacts.channels is not None:
+        checked = match_channels(artifacts.channels, channels)
+    blocks = recording.iter_blocks(channels, block_samples)
+    hasher = None
+    if use_index and digest is None:
+        stamp = _file_stamp(recording.path)
+        hasher = hashlib.blake2b(json.dumps(channels).encode(), digest_size=16)
+        blocks = _hashed(blocks, hasher)
+    batches = []
+    for starts, frames in iter_window_batches(blocks, window_size, hop):
+        mean_square = np.einsum('wsc,wsc->wc', frames, frames, dtype=np.float64) / window_size
+        bad = None if artifacts is None else artifacts.check(frames[:, :, checked], hop)
+        band_power = _band_power(engine, frames, bad, len(band_names))
+        batch = Features(starts, band_power, mean_square, band_names, channels,
+                         recording.fs, window_size, hop, bad)
+        batches.append(batch)
+        yield batch
+    if use_index:
+        if hasher is not None:
+            digest = hasher.hexdigest()
+            remember_hash(recording.path, stamp, digest, channels)
+        save_index(recording.path, index_key(digest, *config),
+                   _concatenate(batches, band_names, channels, recording.fs, window_size, hop))
+
+
+def _read_channels(recording, channels, artifacts):
+    # Recording channel names to read: the requested ones plus any the detector checks
+    names = list(recording.channels if channels is None else channels)
+    if artifacts is not None and artifacts.channels is not None:
+        names += artifacts.channels
+    return [recording.channels[i] for i in dict.fromkeys(match_channels(names, recording.channels))]
+
+
+def _band_power(engine, frames, bad, n_bands):
+    # (n_windows, n_bands, n_chan), NaN for windows flagged in `bad`
+    if engine is None:
+        return np.zeros((len(frames), 0, frames.shape[2]))
+    if bad is None:
+        return engine.compute(frames, axis=1)
+    band_power = np.full((len(frames), n_bands, frames.shape[2]), np.nan)
+    if not bad.all():
+        band_power[~bad] = engine.compute(frames[~bad], axis=1)
+    return band_power
+
+
+def _concatenate(batches, band_names, channels, fs, window_size, hop):
+    n_chan, n_bands = len(channels), len(band_names)
+    if not batches:
+        return Features(np.zeros(0, dtype=int), np.zeros((0, n_bands, n_chan)), np.zeros((0, n_chan)),
+                        band_names, channels, fs, window_size, hop)
+    return Features(np.concatenate([b.starts for b in batches]),
+                    np.concatenate([b.band_power for b in batches]),
+                    np.concatenate([b.mean_square for b in batches]),
+                    band_names, channels, fs, window_size, hop,
+                    np.concatenate([b.bad for b in batches]))
+
+
+def load_features(recording, window_size, bands=EEG_BANDS, block_samples=BLOCK_SAMPLES, use_index=True,
+                  hop=None, artifacts=None, channels=None):
+    """All windows' Features at once (from the index when there is one)."""
+    bands = {'band': bands} if isinstance(bands, tuple) else bands
+    batches = list(iter_features(recording, window_size, bands, block_samples, use_index, hop, artifacts,
+                                 channels))
+    if len(batches) == 1:
+        return batches[0]
+    return _concatenate(batches, list(bands), _read_channels(recording, channels, artifacts), recording.fs,
+                        window_size, int(hop or window_size))
@@ -0,0 +1,172 @@
+# latency.py
+"""
+Latency instrumentation for the live bridges.
+
+Each loop iteration times its stages (pull, buffer, artifacts, spectral,
+mapping, send) and, when MIDI goes out, the end-to-end delay from the newest
+EEG sample's LSL timestamp to the send. Values go into HDR-style histograms: fixed
+log-linear buckets, so recording is O(1) with no allocation, and p50/p99/max
+are read off the bucket counts. Every `report_every` seconds the stats are
+printed and/or appended as one JSON line to a metrics file, then reset.
+"""
+
+import json
+import math
+import time
+
+import numpy as np
+
+STAGES = ("pull", "buffer", "artifacts", "spectral", "mapping", "send")
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of durations in seconds, 1 us to ~1000 s.
+    Each power of two is split into `sub_buckets` linear buckets, which
+    bounds the relative error of a percentile at 1/sub_buckets.
+    """
+
+    def __init__(self, sub_buckets=32, max_exponent=30):
+        self.sub_buckets = sub_buckets
+        self.counts = np.zeros((max_exponent + 1) * sub_buckets, dtype=np.int64)
+        self.count = 0
+        self.max = 0.0
+
+    def _index(self, us):
+        if us < self.sub_buckets:
+            return int(us)
+        exp = int(us).bit_length() - int(self.sub_buckets).bit_length()
+        return min((exp + 1) * self.sub_buckets + (int(us) >> exp) - self.sub_buckets,
+                   len(self.counts) - 1)
+
+    def _value(self, index):
+        # Upper edge of a bucket, in seconds
+        if index < self.sub_buckets:
+            return (index + 1) * 1e-6
+        exp = index // self.sub_buckets - 1
+        return ((index % self.sub_buckets + self.sub_buckets + 1) << exp) * 1e-6
+
+    def record(self, seconds):
+        us = max(0.0, seconds * 1e6)
+        self.counts[self._index(us)] += 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._value(index), self.max)
+
+    def summary(self):
+        """count, p50/p99/max in milliseconds."""
+        return {'count': self.count, 'p50_ms': self.percentile(50) * 1e3,
+                'p99_ms': self.percentile(99) * 1e3, 'max_ms': self.max * 1e3}
+
+    def reset(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.max = 0.0
+
+
+class LatencyMonitor:
+    """
+    Per-stage and end-to-end latency for one live loop.
+
+    clock        : the LSL clock (pylsl.local_clock) so end-to-end delays can
+                   be measured against sample timestamps
+    report_every : seconds between reports (None to only report on demand)
+    log_path     : append one JSON object per report to this file
+    late_after   : end-to-end delays above this many seconds count as late
+    """
+
+    def __init__(self, clock, report_every=5.0, log_path=None, late_after=0.1,
+                 stages=STAGES, echo=True):
+        self.clock = clock
+        self.report_every = report_every
+        self.log_path = log_path
+        self.late_after = late_after
+        self.echo = echo
+        self.stages = {name: LatencyHistogram() for name in stages}
+        self.end_to_end = LatencyHistogram()
+        self.late = 0
+        self.dropped = 0            # samples lost between chunks
+        self.dropped_events = 0     # MIDI messages computed but not sent (e.g. throttled)
+        self.time_correction = 0.0   # remote -> local LSL clock offset
+        self._last_ts = {}          # last sample timestamp per stream
+        self._last_report = time.monotonic()
+
+    def now(self):
+        return self.clock()
+
+    def stage(self, name, since):
+        """Record the time since `since` for stage `name`; returns now for chaining."""
+        now = self.clock()
+        self.stages[name].record(now - since)
+        return now
+
+    def samples(self, timestamps, fs, stream=None):
+        """
+        Count samples lost in gaps between consecutive chunk timestamps of
+        `stream` (any hashable key when several streams share one monitor).
+        Gaps of up to two sample periods are treated as timestamp jitter.
+        """
+        if len(timestamps) == 0 or fs <= 0:
+            return
+        first, last = timestamps[0], timestamps[-1]
+        previous = self._last_ts.get(stream)
+        if previous is not None:
+            gap = (first - previous) * fs - 1
+            if gap > 2:
+                self.dropped += int(round(gap))
+        self._last_ts[stream] = last
+
+    def sent(self, sample_ts, time_correction=None):
+        """
+        Record sample -> send delay for a MIDI message driven by sample_ts
+        (time_correction overrides the monitor's own, for another stream).
+        """
+        if time_correction is None:
+            time_correction = self.time_correction
+        delay = self.clock() - (sample_ts + time_correction)
+        self.end_to_end.record(delay)
+        if delay > self.late_after:
+            self.late += 1
+
+    def drop_event(self, n=1):
+        self.dropped_events += n
+
+    def snapshot(self):
+        return {'time': time.time(),
+                'end_to_end': self.end_to_end.summary(),
+                'stages': {name: h.summary() for name, h in self.stages.items()},
+                'late': self.late, 'dropped_samples': self.dropped,
+                'dropped_events': self.dropped_events}
+
+    def maybe_report(self):
+        if self.report_every is None or time.monotonic() - self._last_report < self.report_every:
+            return None
+        return self.report()
+
+    def report(self):
+        snap = self.snapshot()
+        if self.echo:
+            e2e = snap['end_to_end']
+            stages = " ".join(f"{n}={s['p50_ms']:.2f}/{s['p99_ms']:.2f}" for n, s in snap['stages'].items())
+            print(f"[latency] e2e p50={e2e['p50_ms']:.1f}ms p99={e2e['p99_ms']:.1f}ms max={e2e['max_ms']:.1f}ms "
+                  f"(n={e2e['count']}) late={snap['late']} dropped samples={snap['dropped_samples']} "
+                  f"events={snap['dropped_events']} | "
+                  f"stages p50/p99 ms: {stages}")
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(snap) + "\n")
+        for h in self.stages.values():
+            h.reset()
+        self.end_to_end.reset()
+        self.late = 0
+        self.dropped = 0
+        self.dropped_events = 0
+        self._last_report = time.monotonic()
+        return snap
@@ -0,0 +1,159 @@
+# lsl.py
+"""
+Small helpers around pylsl shared by the live bridges.
+"""
+
+import numpy as np
+
+from .clock import Dejitter
+from .ringbuffer import RingBuffer
+
+# pylsl channel_format codes -> numpy dtypes (cf_string has no numeric equivalent)
+LSL_DTYPES = {1: np.float32, 2: np.float64, 4: np.int32, 5: np.int16, 6: np.int8, 7: np.int64}
+
+
+def pull_buffer(stream_info, max_samples):
+    """Preallocated (max_samples, n_chan) array matching the stream's sample type."""
+    dtype = LSL_DTYPES.get(stream_info.channel_format())
+    if dtype is None:
+        raise RuntimeError(f"Stream '{stream_info.name()}' does not carry numeric samples.")
+    return np.empty((max_samples, stream_info.channel_count()), dtype=dtype)
+
+
+def pull_chunk_into(inlet, dest, timeout=1.0):
+    """
+    pull_chunk() straight into `dest` (see pull_buffer) instead of building
+    nested Python lists. Returns (samples view, timestamps).
+    """
+    _, timestamps = inlet.pull_chunk(timeout=timeout, max_samples=len(dest), dest_obj=dest)
+    return dest[:len(timestamps)], timestamps
+
+
+def time_correction(inlet, timeout=2.0, default=0.0):
+    """Offset to add to the inlet's timestamps to get local_clock() time (`default` if unknown)."""
+    try:
+        return inlet.time_correction(timeout=timeout)
+    except Exception:   # pylsl raises TimeoutError (or LostError) here
+        return default
+
+
+def channel_labels(inlet, n_chan, timeout=2.0):
+    """Channel labels from the stream's full description ("ch0", "ch1", ... where it has none)."""
+    labels = []
+    try:
+        channel = inlet.info(timeout=timeout).desc().child("channels").child("channel")
+        while not channel.empty():
+            labels.append(channel.child_value("label"))
+            channel = channel.next_sibling()
+    except Exception:   # pylsl raises TimeoutError (or LostError) here
+        pass
+    if len(labels) != n_chan or not all(labels):
+        labels = [f"ch{i}" for i in range(n_chan)]
+    return labels
+
+
+# ---- several streams in one process ----
+def resolve_streams_of_type(stream_type="EEG", names=None, timeout=5.0, use_cache=True):
+    """
+    Every LSL stream of `stream_type` (only those called one of `names`, if
+    given), sorted by name so each stream keeps its MIDI channel/CC between
+    runs. With use_cache, the streams found last time (see discovery.py)
+    shorten the wait: named streams are looked up directly, and without
+    names a short scan is enough unless a known stream fails to answer.
+    """
+    from pylsl import resolve_byprop
+    from .discovery import resolve_cached, scan_lsl
+
+    found = resolve_cached(stream_type, names) if use_cache else None
+    if found is None and names:
+        found = resolve_byprop('type', stream_type, minimum=len(names), timeout=timeout)
+        found = [s for s in found if s.name() in names]
+    elif found is None:
+        found = [s for s in scan_lsl(wait_time=min(timeout, 2.0)) if s.type() == stream_type]
+    unique = {s.uid(): s for s in found}
+    return sorted(unique.values(), key=lambda s: (s.name(), s.source_id()))
+
+
+class InletStream:
+    """
+    One LSL stream of a MultiInlet: its inlet, a preallocated pull buffer and
+    a ring buffer holding the latest analysis window. `labels` are the
+    channel labels from the stream description. After a poll,
+    `samples`/`timestamps` hold the chunk that just arrived and `sample_time`
+    is the dejittered local_clock() time of its newest sample.
+    """
+
+    def __init__(self, index, info, window_sec, buffer_chan=None, max_chunklen=1024):
+        from pylsl import StreamInlet
+
+        self.index = index
+        self.info = info
+        self.name = info.name()
+        self.inlet = StreamInlet(info, max_chunklen=max_chunklen)
+        self.fs = float(info.nominal_srate())
+        self.n_chan = int(info.channel_count())
+        self.labels = channel_labels(self.inlet, self.n_chan)
+        self.window_samples = int(max(1, window_sec * self.fs))
+        self.buffer = RingBuffer(self.window_samples, buffer_chan or self.n_chan)
+        self.pull_buf = pull_buffer(info, self.window_samples)
+        self.samples = self.pull_buf[:0]
+        self.timestamps = []
+        self.time_correction = 0.0
+        self.dejitter = Dejitter(self.fs)
+        self.sample_time = None
+
+    def pull(self, timeout=0.0):
+        self.samples, self.timestamps = pull_chunk_into(self.inlet, self.pull_buf, timeout)
+        if self.timestamps:
+            self.sample_time = self.dejitter.update(self.timestamps)[-1] + self.time_correction
+        return len(self.timestamps)
+
+
+class MultiInlet:
+    """
+    Several LSL streams (e.g. one per headset) read from a single loop.
+
+    poll() pulls whatever has arrived on every inlet without blocking, so
+    adding a headset costs one inlet, two small buffers and one non-blocking
+    pull per loop; the spectral work can then be batched across streams
+    with stacked_windows().
+    """
+
+    def __init__(self, infos, window_sec, buffer_chan=None, max_chunklen=1024):
+        self.streams = [InletStream(i, info, window_sec, buffer_chan, max_chunklen)
+                        for i, info in enumerate(infos)]
+
+    def __len__(self):
+        return len(self.streams)
+
+    def __iter__(self):
+        return iter(self.streams)
+
+    def poll(self):
+        """Streams that delivered new samples since the last poll."""
+        return [s for s in self.streams if s.pull(0.0)]
+
+    def update_time_corrections(self, timeout=2.0):
+        for s in self.streams:
+            s.time_correction = time_correction(s.inlet, timeout, default=s.time_correction)
+
+
+def stacked_windows(streams):
+    """
+    Group streams whose window is full by (rate, window length) and put
+    their latest windows side by side, so one spectral call covers them all.
+    Yields (fs, window_samples, members, windows, splits), where windows is
+    (window_samples, total channels) and np.split(result, splits, axis=-1)
+    gives back one part per member.
+    """
+    groups = {}
+    for s in streams:
+        if s.buffer.is_full:
+            groups.setdefault((s.fs, s.window_samples), []).append(s)
+    for (fs, n), members in groups.items():
+        if len(members) == 1:
+            windows = members[0].buffer.latest()    # zero-copy view
+        else:
+            windows = np.hstack([s.buffer.latest() for s in members])
+        splits = np.cumsum([s.buffer.n_chan for s in members])[:-1]
+        yield fs, n, members, windows, splits
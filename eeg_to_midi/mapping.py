@@ -0,0 +1,79 @@
+# mapping.py
+"""
+Band power -> MIDI note/velocity mappings used by the prerecorded bridges.
+
+Each function works on whole arrays of window powers, so a full recording can
+be mapped in one call. Scalars work too.
+"""
+
+import numpy as np
+
+
+def power_to_midi_value(power, power_range=(0, 100)):
+    """Linear map of power onto 0-127 (clipped)."""
+    return np.clip(np.interp(power, power_range, [0, 127]), 0, 127).astype(int)
+
+
+def map_power_to_notes(power, note_low, note_high, vel_min, vel_max, power_range=(0, 100)):
+    """
+    Mapping used by bridge_prerecorded / _multiband: louder band -> higher note.
+    Returns (notes, velocities) as int arrays.
+    """
+    midi_value = power_to_midi_value(power, power_range)
+    notes = note_low + (midi_value * (note_high - note_low) // 127)
+    velocities = np.clip(midi_value, vel_min, vel_max).astype(int)
+    return notes, velocities
+
+
+def map_intensity(z, sensitivity, note_low, note_high, vel_min, vel_max):
+    """
+    Mapping used by bridge_prerecorded_combinedwaves: z-scored power, scaled to
+    0-10 by `sensitivity`, then onto notes and velocities.
+    Returns (notes, velocities, scaled).
+    """
+    scaled = np.clip(np.asarray(z) * sensitivity + 5, 0, 10)
+    midi_value = np.clip(np.interp(scaled, [0, 10], [0, 127]), 0, 127).astype(int)
+    notes = note_low + (midi_value * (note_high - note_low) // 127)
+    velocities = np.clip(np.interp(midi_value, [0, 127], [vel_min, vel_max]),
+                         vel_min, vel_max).astype(int)
+    return notes, velocities, scaled
+
+
+def dynamic_window(scaled, window_sec_base, tempo_scale):
+    """Tempo modulation: more intense windows -> shorter notes (0.3-1.0 x base)."""
+    return window_sec_base * np.clip(1.0 - (tempo_scale * (np.asarray(scaled) / 10.0)), 0.3, 1.0)
+
+
+class HysteresisGate:
+    """
+    Per-channel note on/off with hysteresis, evaluated for all channels at once.
+
+    A channel turns on when its normalised power reaches on_threshold and
+    off when it drops to off_threshold, or when it has been on longer than
+    silence_after seconds and sits just above off_threshold (safety).
+    Held channels (e.g. flagged as artifacts) keep their state, except that
+    a note held longer than silence_after is still turned off.
+    """
+
+    def __init__(self, n_chan, on_threshold, off_threshold, silence_after, silence_margin=0.05):
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.silence_after = silence_after
+        self.silence_margin = silence_margin
+        self.is_on = np.zeros(n_chan, dtype=bool)
+        self.last_on_time = np.zeros(n_chan)
+
+    def update(self, norm, now, hold=None):
+        """Returns boolean masks (turn_on, turn_off) and updates the state."""
+        norm = np.asarray(norm)
+        expired = now - self.last_on_time > self.silence_after
+        turn_on = ~self.is_on & (norm >= self.on_threshold)
+        stale = expired & (norm < self.off_threshold + self.silence_margin)
+        turn_off = self.is_on & ((norm <= self.off_threshold) | stale)
+        if hold is not None:
+            turn_on &= ~hold
+            turn_off = np.where(hold, self.is_on & expired, turn_off)
+        self.is_on[turn_on] = True
+        self.last_on_time[turn_on] = now
+        self.is_on[turn_off] = False
+        return turn_on, turn_off
@@ -0,0 +1,237 @@
+# midi.py
+"""
+MIDI port helpers shared by the bridges.
+
+AsyncMidiOut takes MIDI output off the analysis loop: send() only queues the
+message and one sender thread per port writes it out, so a slow virtual port
+never stalls EEG ingestion. Continuous controllers (CC, pitch bend,
+aftertouch) are coalesced: a new value for the same (channel, controller)
+replaces one still waiting, so only the latest value is sent. Note messages
+keep their order and go ahead of controllers, note-offs are never dropped,
+and a token bucket caps each port's message rate so many channels and
+controllers cannot flood the DAW.
+"""
+
+import threading
+import time
+from collections import deque
+
+from .latency import LatencyHistogram
+
+MAX_RATE = 1000     # messages/s per port (about what a DIN MIDI cable carries)
+
+
+class FakeMidiPort:
+    """
+    Stand-in for a mido output port: counts (and optionally keeps) messages
+    instead of sending them, so pipelines run headless without loopMIDI.
+    """
+
+    def __init__(self, name="fake", keep=False):
+        self.name = name
+        self.keep = keep
+        self.messages = []      # (perf_counter, message) when keep=True
+        self.sent = 0
+        self.closed = False
+
+    def send(self, msg):
+        self.sent += 1
+        if self.keep:
+            self.messages.append((time.perf_counter(), msg))
+
+    def close(self):
+        self.closed = True
+
+
+def open_output(name, fallback=True):
+    """
+    Open MIDI output port `name`. If it does not exist, use the first port
+    there is (fallback=True) or raise. Ports are only listed when the open
+    fails, since listing them costs a backend round trip.
+    """
+    import mido
+
+    try:
+        port = mido.open_output(name)
+        print(f"✅ Connected to MIDI port: {name}")
+        return port
+    except IOError:
+        ports = mido.get_output_names()
+    if fallback and ports:
+        print(f"⚠️ Using fallback MIDI port: {ports[0]}")
+        return mido.open_output(ports[0])
+    raise RuntimeError(f"MIDI output '{name}' not available (ports: {ports}). "
+                       "Create one via loopMIDI or IAC.")
+
+
+def _coalesce_key(msg):
+    # Messages where only the latest value matters; None for everything else
+    if msg.type == 'control_change':
+        return ('cc', msg.channel, msg.control)
+    if msg.type == 'pitchwheel':
+        return ('pitch', msg.channel)
+    if msg.type == 'aftertouch':
+        return ('touch', msg.channel)
+    if msg.type == 'polytouch':
+        return ('polytouch', msg.channel, msg.note)
+    return None
+
+
+def _is_note_off(msg):
+    return msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0)
+
+
+class _PortSender:
+    """Queue and sender thread for one output port."""
+
+    def __init__(self, port, max_rate, burst, max_queue):
+        self.port = port
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.notes = deque()        # (enqueue time, msg), FIFO so on/off order is kept
+        self.controls = {}          # coalesce key -> (enqueue time, msg), oldest key first
+        self.queue_delay = LatencyHistogram()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._tokens = float(burst)
+        self._refill_t = time.perf_counter()
+        self._cv = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"midi-out-{getattr(port, 'name', '')}",
+                                        daemon=True)
+        self._thread.start()
+
+    def put(self, msg, now):
+        with self._cv:
+            key = _coalesce_key(msg)
+            if key is not None:
+                if key in self.controls:
+                    self.coalesced += 1
+                    # Keep the queue position (and enqueue time) of the value it replaces
+                    self.controls[key] = (self.controls[key][0], msg)
+                    return
+                self.controls[key] = (now, msg)
+            elif len(self.notes) >= self.max_queue and not _is_note_off(msg):
+                self.dropped += 1   # full: shed new notes, but never a note-off
+                return
+            else:
+                self.notes.append((now, msg))
+            depth = len(self.notes) + len(self.controls)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self._cv.notify()
+
+    def _next(self):
+        # Notes (including note-offs) first, then the oldest pending controller
+        if self.notes:
+            return self.notes.popleft()
+        key = next(iter(self.controls))
+        return self.controls.pop(key)
+
+    def _wait_for_token(self):
+        # Token bucket: up to `burst` messages back to back, `max_rate` per second on average
+        if not self.max_rate:
+            return
+        now = time.perf_counter()
+        self._tokens = min(self.burst, self._tokens + (now - self._refill_t) * self.max_rate)
+        self._refill_t = now
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self.max_rate)
+            self._tokens, self._refill_t = 1.0, time.perf_counter()
+        self._tokens -= 1
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while self._running and not (self.notes or self.controls):
+                    self._cv.wait()
+                if not (self.notes or self.controls):
+                    return
+                t_queued, msg = self._next()
+                if not (self.notes or self.controls):
+                    self._cv.notify_all()   # wake flush()
+            # Rate limiting and the send itself happen outside the lock, so
+            # put() never waits on the port; meanwhile new values can still
+            # coalesce into the ones that are queued
+            self._wait_for_token()
+            self.port.send(msg)
+            self.queue_delay.record(time.perf_counter() - t_queued)
+            self.sent += 1
+
+    def flush(self, timeout=None):
+        with self._cv:
+            return self._cv.wait_for(lambda: not (self.notes or self.controls), timeout=timeout)
+
+    def stop(self, discard=False):
+        """Stop the thread once the queue is empty; discard=True first drops everything but note-offs."""
+        with self._cv:
+            if discard:
+                offs = deque(item for item in self.notes if _is_note_off(item[1]))
+                self.dropped += len(self.notes) - len(offs) + len(self.controls)
+                self.notes = offs
+                self.controls.clear()
+            self._running = False
+            self._cv.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        return {'port': getattr(self.port, 'name', str(self.port)), 'sent': self.sent,
+                'coalesced': self.coalesced, 'dropped': self.dropped, 'max_depth': self.max_depth,
+                'queued': len(self.notes) + len(self.controls), **self.queue_delay.summary()}
+
+
+class AsyncMidiOut:
+    """
+    Non-blocking MIDI output with the interface of a mido port (send/close),
+    fanning every message out to one or more ports.
+
+    ports     : a port or a list of ports (anything with .send/.close)
+    max_rate  : messages per second per port (None = unlimited)
+    burst     : messages a port may send back to back before the limit applies
+    max_queue : note messages waiting per port; beyond this new note-ons are
+                dropped (note-offs always get through)
+    """
+
+    def __init__(self, ports, max_rate=MAX_RATE, burst=32, max_queue=1024):
+        if not isinstance(ports, (list, tuple)):
+            ports = [ports]
+        self.ports = list(ports)
+        self.name = ", ".join(getattr(p, 'name', '?') for p in self.ports)
+        self._senders = [_PortSender(p, max_rate, burst, max_queue) for p in self.ports]
+
+    def send(self, msg):
+        now = time.perf_counter()
+        for sender in self._senders:
+            sender.put(msg, now)
+
+    def flush(self, timeout=None):
+        """Wait until every queued message has been sent; False on timeout."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        done = True
+        for sender in self._senders:
+            left = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done = sender.flush(left) and done
+        return done
+
+    def stats(self):
+        return [sender.stats() for sender in self._senders]
+
+    def report(self):
+        for s in self.stats():
+            print(f"MIDI out {s['port']}: sent={s['sent']} coalesced={s['coalesced']} dropped={s['dropped']} "
+                  f"max queue={s['max_depth']} | queue delay p50={s['p50_ms']:.2f}ms p99={s['p99_ms']:.2f}ms "
+                  f"max={s['max_ms']:.2f}ms")
+
+    def close(self, timeout=1.0):
+        """
+        Send what is still queued for up to `timeout` s; after that, drop
+        whatever is left except note-offs, send those, and close the ports.
+        """
+        done = self.flush(timeout)
+        for sender in self._senders:
+            sender.stop(discard=not done)
+        for port in self.ports:
+            port.close()
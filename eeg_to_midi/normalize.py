@@ -0,0 +1,229 @@
+# normalize.py
+"""
+Running normalisers for mapping EEG features onto MIDI ranges as data arrives.
+"""
+
+from bisect import bisect_right
+from collections import deque
+
+import numpy as np
+
+
+class OnlineNormalizer:
+    """
+    Running mean / standard deviation for z-scoring values one at a time
+    (Welford's algorithm), so a recording or live stream can be normalised
+    without a first pass over all of it.
+
+    forgetting : None for plain cumulative statistics, or a weight in (0, 1)
+                 for exponentially forgetting old values (e.g. 0.02 ~ the last
+                 50 values dominate)
+    warmup     : number of values before z-scores are reported; until then
+                 zscore() returns 0 (the middle of the mapping)
+    """
+
+    def __init__(self, forgetting=None, warmup=0, min_std=1e-12):
+        if forgetting is not None and not 0 < forgetting < 1:
+            raise ValueError("forgetting must be in (0, 1) or None")
+        self.forgetting = forgetting
+        self.warmup = int(warmup)
+        self.min_std = min_std
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0      # sum of squared deviations (cumulative) or variance (forgetting)
+
+    @property
+    def var(self):
+        if self.count == 0:
+            return 0.0
+        return self._m2 if self.forgetting is not None else self._m2 / self.count
+
+    @property
+    def std(self):
+        return max(np.sqrt(self.var), self.min_std)
+
+    @property
+    def warmed_up(self):
+        return self.count >= max(self.warmup, 1)
+
+    def update(self, x):
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        if self.forgetting is None:
+            self.mean += delta / self.count
+            self._m2 += delta * (x - self.mean)
+        elif self.count == 1:
+            self.mean = x
+        else:
+            a = self.forgetting
+            self.mean += a * delta
+            self._m2 = (1 - a) * (self._m2 + a * delta * delta)
+
+    def zscore(self, x):
+        """z-score of x against the current statistics (0 during warm-up)."""
+        x = np.asarray(x, dtype=float)
+        if not self.warmed_up:
+            return np.zeros_like(x)
+        return (x - self.mean) / self.std
+
+    def update_many(self, values):
+        """Update with each value in turn; returns each value's z-score at the time it arrived."""
+        values = np.asarray(values, dtype=float).ravel()
+        z = np.empty_like(values)
+        for k, v in enumerate(values):
+            self.update(v)
+            z[k] = self.zscore(v)
+        return z
+
+    def fit(self, values):
+        """Update with all values, without z-scoring them (two-pass baseline)."""
+        for v in np.asarray(values, dtype=float).ravel():
+            self.update(v)
+        return self
+
+
+class RollingMinMax:
+    """
+    Min-max scaling over a rolling window with amortised O(1) updates.
+
+    Two monotonic deques hold the only values that can still become the
+    window's min or max, so nothing is rescanned per update.
+
+    window  : number of updates, or seconds when by_time=True (then pass t
+              to update(), from a monotonic clock such as pylsl.local_clock:
+              entries are evicted assuming t never decreases)
+    """
+
+    def __init__(self, window, by_time=False, min_range=1e-12):
+        self.window = window
+        self.by_time = by_time
+        self.min_range = min_range
+        self._min_q = deque()   # (key, value), values increasing
+        self._max_q = deque()   # (key, value), values decreasing
+        self._n = 0
+
+    @property
+    def min(self):
+        return self._min_q[0][1]
+
+    @property
+    def max(self):
+        return self._max_q[0][1]
+
+    def push(self, value, t=None):
+        if self.by_time:
+            if t is None:
+                raise ValueError("A time-based window needs t")
+            key = t
+        else:
+            key = self._n
+        self._n += 1
+        while self._max_q and self._max_q[-1][1] <= value:
+            self._max_q.pop()
+        self._max_q.append((key, value))
+        while self._min_q and self._min_q[-1][1] >= value:
+            self._min_q.pop()
+        self._min_q.append((key, value))
+        # Drop entries that have left the window
+        cutoff = key - self.window
+        while self._max_q[0][0] <= cutoff:
+            self._max_q.popleft()
+        while self._min_q[0][0] <= cutoff:
+            self._min_q.popleft()
+
+    def normalize(self, value):
+        lo, hi = self.min, self.max
+        return float(np.clip((value - lo) / max(self.min_range, hi - lo), 0, 1))
+
+    def update(self, value, t=None):
+        """Add a value and return it scaled to 0-1 against the window."""
+        self.push(value, t)
+        return self.normalize(value)
+
+
+class P2Quantile:
+    """
+    Streaming estimate of one quantile in constant memory (the P-squared
+    algorithm of Jain & Chlamtac): five markers are nudged towards their
+    ideal positions with a parabolic fit on every update.
+    """
+
+    def __init__(self, q):
+        if not 0 < q < 1:
+            raise ValueError("q must be in (0, 1)")
+        self.q = q
+        self._init = []
+        self._heights = None
+        # Five markers are plain lists: per-element numpy ops would dominate the cost
+        self._pos = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self._desired = [1.0, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5.0]
+        self._step = [0.0, q / 2, q, (1 + q) / 2, 1.0]
+
+    @property
+    def value(self):
+        if self._heights is None:
+            return float(np.quantile(self._init, self.q)) if self._init else 0.0
+        return float(self._heights[2])
+
+    def update(self, x):
+        if self._heights is None:
+            self._init.append(x)
+            if len(self._init) == 5:
+                self._heights = sorted(self._init)
+            return
+        h, n = self._heights, self._pos
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect_right(h, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        self._desired = [dp + st for dp, st in zip(self._desired, self._step)]
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1.0 if d > 0 else -1.0
+                hp = h[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1]))
+                if not h[i - 1] < hp < h[i + 1]:
+                    j = i + int(d)
+                    hp = h[i] + d * (h[j] - h[i]) / (n[j] - n[i])
+                h[i] = hp
+                n[i] += d
+
+
+class QuantileScaler:
+    """
+    Robust 0-1 scaling between two streaming quantiles (default 5th-95th
+    percentile), so single blinks or spikes do not squash the range the way
+    they do with min-max. O(1) time and memory per update.
+    """
+
+    def __init__(self, low=0.05, high=0.95, min_range=1e-12):
+        self._low = P2Quantile(low)
+        self._high = P2Quantile(high)
+        self.min_range = min_range
+
+    @property
+    def min(self):
+        return self._low.value
+
+    @property
+    def max(self):
+        return self._high.value
+
+    def normalize(self, value):
+        lo, hi = self.min, self.max
+        return float(np.clip((value - lo) / max(self.min_range, hi - lo), 0, 1))
+
+    def update(self, value, t=None):
+        """Add a value and return it scaled to 0-1 (t is accepted for interface parity)."""
+        self._low.update(value)
+        self._high.update(value)
+        return self.normalize(value)
@@ -0,0 +1,342 @@
+# recording.py
+"""
+Streaming readers for prerecorded EEG.
+
+Recordings are read in fixed-size sample blocks (selected channels only,
+float32) and cut into analysis windows as they arrive, so the first notes
+come out right away and memory use does not grow with file length.
+
+.csv and .xdf files are both supported. On first load every channel is also
+written to a raw float32 cache next to the recording (<file>.cache.f32 plus a
+<file>.cache.json sidecar with rate, labels and the source's size/mtime).
+Later runs memory-map the cache instead of parsing the file again. Where the
+cache cannot be written (a read-only study archive, a full disk) recordings
+are simply read without it.
+"""
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from .spectral import frame_windows
+
+BLOCK_SAMPLES = 256 * 60    # one minute of Muse data per read
+
+
+# ---- binary cache ----
+def cache_paths(path):
+    return Path(str(path) + ".cache.f32"), Path(str(path) + ".cache.json")
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns}
+
+
+def load_cache(path):
+    """(memmap, metadata) for a valid cache of `path`, else None."""
+    data_path, meta_path = cache_paths(path)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        stamp = _source_stamp(path)
+        if any(meta.get(k) != v for k, v in stamp.items()):
+            return None     # recording changed since the cache was written
+        shape = (meta['n_samples'], len(meta['channels']))
+        if data_path.stat().st_size != shape[0] * shape[1] * np.dtype(np.float32).itemsize:
+            return None     # data file truncated or replaced: rebuild
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=np.float32), meta
+    return np.memmap(data_path, dtype=np.float32, mode='r', shape=shape), meta
+
+
+def _tmp(path):
+    return path.with_name(path.name + ".tmp")
+
+
+def _write_meta(path, fs, channels, n_samples, **extra):
+    meta = {'fs': fs, 'channels': list(channels), 'n_samples': int(n_samples), **extra,
+            **_source_stamp(path)}
+    meta_path = cache_paths(path)[1]
+    with open(_tmp(meta_path), 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(_tmp(meta_path), meta_path)
+    return meta
+
+
+def _open_cache_file(path):
+    """Temp file for the cache data of `path`, or None where it cannot be written."""
+    try:
+        return open(_tmp(cache_paths(path)[0]), 'wb')
+    except OSError:
+        return None
+
+
+def _discard_cache_file(f):
+    try:
+        f.close()
+        Path(f.name).unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _commit_cache_file(path, f, fs, channels, n_samples, **extra):
+    """
+    Move a completely written cache file into place and write its sidecar.
+    Returns the metadata, or None if that failed (the run goes on uncached).
+    """
+    data_path, meta_path = cache_paths(path)
+    try:
+        f.close()
+        meta_path.unlink(missing_ok=True)   # an old sidecar must not describe the new data
+        os.replace(f.name, data_path)
+        return _write_meta(path, fs, channels, n_samples, **extra)
+    except OSError:
+        _discard_cache_file(f)
+        return None
+
+
+def _write_cache(path, data, fs, channels, **extra):
+    """Write `data` as the cache of `path`; metadata, or None if it could not be written."""
+    f = _open_cache_file(path)
+    if f is None:
+        return None
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    try:
+        data.tofile(f)
+    except OSError:
+        _discard_cache_file(f)
+        return None
+    return _commit_cache_file(path, f, fs, channels, len(data), **extra)
+
+
+# ---- channel labels ----
+def _bare_label(label):
+    # XDF streams label channels like "EEG_AF7"; the bridges ask for "AF7"
+    return re.sub(r'^EEG[_ ]', '', str(label), flags=re.IGNORECASE)
+
+
+def match_channels(names, labels, required=True):
+    """Column index of each requested channel name in `labels` (required=False skips missing ones)."""
+    indices, missing = [], []
+    bare = [_bare_label(label) for label in labels]
+    for name in names:
+        if name in labels:
+            indices.append(labels.index(name))
+        elif _bare_label(name) in bare:
+            indices.append(bare.index(_bare_label(name)))
+        else:
+            missing.append(name)
+    if missing and required:
+        raise ValueError(f"Missing channels in recording: {missing} (available: {labels})")
+    return indices
+
+
+# ---- recordings ----
+class Recording:
+    """
+    A prerecorded session held in a (n_samples, n_chan) array, usually a
+    read-only memmap of the cache.
+    """
+
+    def __init__(self, path, fs, channels, data):
+        self.path = path
+        self.fs = float(fs)
+        self.channels = list(channels)
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def iter_blocks(self, names, block_samples=BLOCK_SAMPLES):
+        """Yield (n_samples, len(names)) float32 blocks of the named channels."""
+        idx = match_channels(names, self.channels)
+        if idx == list(range(len(self.channels))):
+            idx = slice(None)   # every channel in order: plain slices, no gather
+        for i in range(0, len(self.data), block_samples):
+            yield np.asarray(self.data[i:i + block_samples, idx], dtype=np.float32)
+
+
+class CsvRecording(Recording):
+    """
+    A CSV recording that has not been cached yet. Blocks are streamed from
+    the text file and written to the cache as they go by, so the first run
+    still starts immediately and the next one memory-maps the cache.
+    """
+
+    def __init__(self, path, fs, write_cache=True):
+        super().__init__(path, fs, csv_channels(path), data=None)
+        self.write_cache = write_cache
+
+    def __len__(self):
+        raise TypeError("Length of an uncached CSV recording is only known after reading it")
+
+    def iter_blocks(self, names, block_samples=BLOCK_SAMPLES):
+        idx = match_channels(names, self.channels)
+        cache = _open_cache_file(self.path) if self.write_cache else None
+        if cache is None:
+            # Nothing to cache: parse only the requested columns
+            yield from iter_csv_blocks(self.path, [self.channels[i] for i in idx], block_samples)
+            return
+        n_samples = 0
+        try:
+            for block in iter_csv_blocks(self.path, self.channels, block_samples):
+                if cache is not None:
+                    try:
+                        block.tofile(cache)
+                    except OSError:
+                        # e.g. disk full: go on without a cache
+                        _discard_cache_file(cache)
+                        cache = None
+                n_samples += len(block)
+                yield block[:, idx]
+            if cache is not None:
+                _commit_cache_file(self.path, cache, self.fs, self.channels, n_samples)
+                cache = None
+        finally:
+            if cache is not None:
+                # Stopped early: never leave a partial cache behind
+                _discard_cache_file(cache)
+
+
+def _csv_rate(path):
+    # Sample rate from the Time column, if there is one
+    import pandas as pd
+
+    if "Time" not in pd.read_csv(path, nrows=0).columns:
+        return None
+    t = pd.read_csv(path, usecols=["Time"], nrows=1000)["Time"].to_numpy(dtype=float)
+    step = np.median(np.diff(t)) if len(t) > 1 else 0
+    return float(round(1.0 / step)) if step > 0 else None
+
+
+def load_xdf(path, stream_type="EEG"):
+    """
+    (data, fs, channel labels, stream name, timestamps) of the first stream
+    of `stream_type` in an XDF file. The timestamps are as recorded (not
+    dejittered), so they keep the original chunking and gaps.
+    """
+    try:
+        import pyxdf
+    except ImportError:
+        raise RuntimeError("Reading .xdf files needs pyxdf (pip install pyxdf).") from None
+    streams, _ = pyxdf.load_xdf(str(path), select_streams=[{'type': stream_type}], dejitter_timestamps=False)
+    if not streams:
+        raise RuntimeError(f"No '{stream_type}' stream in {path}.")
+    stream = streams[0]
+    info = stream['info']
+    n_chan = int(info['channel_count'][0])
+    labels = []
+    try:
+        for ch in info['desc'][0]['channels'][0]['channel']:
+            labels.append(ch['label'][0])
+    except (IndexError, KeyError, TypeError):
+        pass
+    if len(labels) != n_chan:
+        labels = [f"ch{i}" for i in range(n_chan)]
+    fs = float(info['nominal_srate'][0])
+    if fs <= 0:
+        # irregular stream: fall back to the effective rate of the timestamps
+        fs = float(info.get('effective_srate', 0))
+    data = np.asarray(stream['time_series'], dtype=np.float32).reshape(-1, n_chan)
+    timestamps = np.asarray(stream['time_stamps'], dtype=np.float64)
+    return data, fs, labels, info['name'][0], timestamps
+
+
+def open_recording(path, fs=None, stream_type="EEG", use_cache=True):
+    """
+    Open a .csv or .xdf recording, through the binary cache when possible.
+
+    fs only applies to CSV files (XDF files carry their nominal rate); if it
+    is None it is taken from the CSV's Time column.
+    """
+    path = Path(path)
+    is_xdf = path.suffix.lower() == ".xdf"
+    if use_cache:
+        cached = load_cache(path)
+        if cached is not None:
+            data, meta = cached
+            rate = meta['fs'] if fs is None or is_xdf else fs
+            return Recording(path, rate, meta['channels'], data)
+
+    if is_xdf:
+        data, rate, labels, name, _ = load_xdf(path, stream_type)
+        if use_cache and _write_cache(path, data, rate, labels, stream=name) is not None:
+            cached = load_cache(path)     # reopen as a memmap
+            if cached is not None:
+                data = cached[0]
+        return Recording(path, rate, labels, data)
+
+    if fs is None:
+        fs = _csv_rate(path)
+        if fs is None:
+            raise ValueError(f"No sample rate given and no Time column in {path}.")
+    return CsvRecording(path, fs, write_cache=use_cache)
+
+
+def csv_channels(path, sniff_rows=1000):
+    """
+    Numeric columns of a CSV recording: every column except Time and those
+    whose first `sniff_rows` rows hold text (markers, annotations).
+    """
+    import pandas as pd
+
+    head = pd.read_csv(path, nrows=sniff_rows)
+    return [c for c in head.columns
+            if c != "Time" and (pd.api.types.is_numeric_dtype(head[c]) or head[c].isna().all())]
+
+
+def iter_csv_blocks(path, channels, block_samples=BLOCK_SAMPLES, dtype=np.float32):
+    """
+    Yield (n_samples, n_chan) blocks of the selected channels, in order.
+    Text further down a numeric column (e.g. an occasional event in a
+    mostly empty Muse "Elements" column) reads as NaN.
+    """
+    import pandas as pd     # only CSV reading needs pandas (cached recordings are memory-mapped)
+
+    columns = pd.read_csv(path, nrows=0).columns
+    missing = [ch for ch in channels if ch not in columns]
+    if missing:
+        raise ValueError(f"Missing channels in CSV: {missing}")
+    reader = pd.read_csv(path, usecols=channels, chunksize=block_samples)
+    with reader:
+        for chunk in reader:
+            # usecols keeps file order; restore the requested order
+            chunk = chunk[channels]
+            text = [c for c in channels if not pd.api.types.is_numeric_dtype(chunk[c])]
+            if text:
+                chunk = chunk.assign(**{c: pd.to_numeric(chunk[c], errors='coerce') for c in text})
+            yield chunk.to_numpy(dtype=dtype)
+
+
+def iter_window_batches(blocks, window_size, hop=None):
+    """
+    Cut a stream of sample blocks into windows starting every `hop` samples
+    (default: window_size, i.e. non-overlapping).
+
+    Yields (starts, frames): the start sample of each window and a
+    (n_windows, window_size, n_chan) view of them. Windows are the same as
+    frame_starts() over the whole recording: every complete window, so one
+    that ends exactly on the last sample is played too.
+    """
+    hop = int(hop or window_size)
+    pending = None
+    base = 0
+    skip = 0    # samples still to drop when hop > window_size
+    for block in blocks:
+        if skip:
+            dropped = min(skip, len(block))
+            block, skip = block[dropped:], skip - dropped
+        pending = block if pending is None else np.concatenate([pending, block])
+        frames = frame_windows(pending, window_size, hop)
+        n = len(frames)
+        if n:
+            yield base + hop * np.arange(n), frames
+            skip = max(0, n * hop - len(pending))
+            pending = pending[n * hop:]
+            base += n * hop
@@ -0,0 +1,89 @@
+# render.py
+"""
+Offline rendering: turn per-window note arrays into a standard MIDI file.
+
+No port is opened and nothing sleeps, so a recording renders as fast as the
+band powers can be computed. Event times are in seconds of EEG time and are
+written as delta ticks at a fixed tempo.
+"""
+
+import numpy as np
+import mido
+
+DEFAULT_BPM = 120
+DEFAULT_TICKS_PER_BEAT = 480
+
+
+def note_events(onsets, durations, notes, velocities, channel=0):
+    """
+    Build a time-sorted list of (time_sec, mido.Message) note_on/note_off pairs.
+    All arguments may be arrays (one entry per note) or scalars.
+    At equal times note_offs come first, so a repeated note retriggers cleanly.
+    """
+    onsets, durations, notes, velocities, channel = np.broadcast_arrays(
+        onsets, durations, notes, velocities, channel)
+    events = []
+    for t, d, n, v, c in zip(onsets.ravel(), durations.ravel(), notes.ravel(),
+                             velocities.ravel(), channel.ravel()):
+        n, v, c = int(n), int(v), int(c)
+        events.append((float(t), 1, mido.Message('note_on', note=n, velocity=v, channel=c)))
+        events.append((float(t + d), 0, mido.Message('note_off', note=n, velocity=v, channel=c)))
+    events.sort(key=lambda e: (e[0], e[1]))
+    return [(t, msg) for t, _, msg in events]
+
+
+def _event_order(event):
+    t, msg = event
+    return t, msg.type == 'note_on' and msg.velocity > 0
+
+
+def events_to_track(events, bpm=DEFAULT_BPM, ticks_per_beat=DEFAULT_TICKS_PER_BEAT):
+    """Convert (time_sec, message) pairs to a MidiTrack with delta-tick times."""
+    events = sorted(events, key=_event_order)
+    tempo = mido.bpm2tempo(bpm)
+    track = mido.MidiTrack()
+    track.append(mido.MetaMessage('set_tempo', tempo=tempo, time=0))
+    # Round absolute times, then difference, so rounding error never accumulates
+    ticks = [int(round(mido.second2tick(t, ticks_per_beat, tempo))) for t, _ in events]
+    last = 0
+    for tick, (_, msg) in zip(ticks, events):
+        track.append(msg.copy(time=max(0, tick - last)))
+        last = max(last, tick)
+    track.append(mido.MetaMessage('end_of_track', time=0))
+    return track
+
+
+def write_midi_file(events, path, bpm=DEFAULT_BPM, ticks_per_beat=DEFAULT_TICKS_PER_BEAT):
+    """Write (time_sec, message) pairs to a type-0 .mid file and return its path."""
+    mid = mido.MidiFile(type=0, ticks_per_beat=ticks_per_beat)
+    mid.tracks.append(events_to_track(events, bpm, ticks_per_beat))
+    mid.save(path)
+    return path
+
+
+class MidiFileSink:
+    """
+    Collects events while a recording is analysed and writes them on finish().
+    Same interface as scheduler.PlaybackSink, so a bridge can switch between
+    rendering and playing with one setting.
+    """
+
+    def __init__(self, path, bpm=DEFAULT_BPM, ticks_per_beat=DEFAULT_TICKS_PER_BEAT):
+        self.path = path
+        self.bpm = bpm
+        self.ticks_per_beat = ticks_per_beat
+        self.events = []
+
+    def add(self, events):
+        self.events.extend(events)
+
+    def log(self, t, text):
+        pass    # nothing to print in time with when rendering
+
+    def finish(self):
+        write_midi_file(self.events, self.path, self.bpm, self.ticks_per_beat)
+        n_notes = sum(msg.type == 'note_on' for _, msg in self.events)
+        print(f"Rendered {n_notes} notes to {self.path}")
+
+    def close(self):
+        pass
@@ -0,0 +1,194 @@
+# replay.py
+"""
+Replay a recorded session as a live LSL stream, as a stand-in for the
+headset when testing the live bridges.
+
+    python -m eeg_to_midi.replay 30s_eeg.xdf                  # real time, looped
+    python -m eeg_to_midi.replay cleaned_eeg.csv --speed 4    # 4x real time
+    python -m eeg_to_midi.replay --synthetic 64 --fs 1000 --speed max
+    python -m eeg_to_midi.replay 30s_eeg.xdf --jitter 0.005 --dropout 0.01
+
+XDF recordings are replayed with their original timing: pushes follow the
+recorded timestamps, so bursts, gaps and clock drift come through as they
+were, with a new chunk at each burst or gap (and every 12 samples within
+evenly stamped runs). CSV and synthetic data (or --nominal) go out in chunks
+of 12 samples, like a Muse packet, at the nominal rate. Either way time
+runs at --speed; "max" pushes as fast as LSL takes them. The outlet
+carries the recording's rate and channel labels, so the bridges size
+their windows exactly as they would for the device. --jitter
+delays each push by a random amount and --dropout drops whole runs of
+chunks, for testing how the bridges cope with an unreliable link.
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from .recording import load_xdf, open_recording
+from .synthetic import synthetic_eeg
+
+CHUNK_SAMPLES = 12      # samples per push (one Muse EEG packet)
+
+
+def make_outlet(name, fs, channels, stream_type="EEG", source_id=None, chunk=CHUNK_SAMPLES):
+    """float32 LSL outlet with the channel labels in the stream description."""
+    from pylsl import StreamInfo, StreamOutlet
+
+    info = StreamInfo(name, stream_type, len(channels), fs, 'float32', source_id or f"replay-{name}")
+    desc = info.desc().append_child("channels")
+    for label in channels:
+        ch = desc.append_child("channel")
+        ch.append_child_value("label", label)
+        ch.append_child_value("unit", "microvolts")
+        ch.append_child_value("type", stream_type)
+    info.desc().append_child_value("manufacturer", "eeg_to_midi replay")
+    return StreamOutlet(info, chunk_size=chunk)
+
+
+def chunk_schedule(n_samples, fs, chunk=CHUNK_SAMPLES, timestamps=None):
+    """
+    (bounds, offsets, duration) of one pass over the data: push k sends
+    samples bounds[k]:bounds[k + 1], offsets[k] seconds after the pass
+    starts, and the pass lasts `duration` seconds.
+
+    Without timestamps, `chunk` samples go out every chunk / fs seconds
+    (a trailing partial chunk is left out). With the recorded timestamps,
+    a chunk ends where the next sample arrived separately (it is stamped
+    more than a quarter period later) and either a gap follows (more than
+    1.5 periods) or the chunk has reached `chunk` samples; it is pushed
+    at the time of its last sample.
+    """
+    period = 1.0 / fs
+    if timestamps is None:
+        n_chunks = n_samples // chunk
+        bounds = np.arange(n_chunks + 1) * chunk
+        return bounds, np.arange(n_chunks) * chunk * period, n_chunks * chunk * period
+    t = np.asarray(timestamps, dtype=np.float64)[:n_samples]
+    d = np.diff(t)
+    bounds = [0]
+    for i in np.flatnonzero(d > 0.25 * period) + 1:
+        if d[i - 1] > 1.5 * period or i - bounds[-1] >= chunk:
+            bounds.append(int(i))
+    bounds.append(len(t))
+    bounds = np.asarray(bounds)
+    return bounds, t[bounds[1:] - 1] - t[0], t[-1] - t[0] + period
+
+
+def replay(data, fs, outlet, chunk=CHUNK_SAMPLES, speed=1.0, jitter=0.0, dropout=0.0,
+           dropout_chunks=(1, 10), loop=True, seed=0, stop=None, stats=None, timestamps=None):
+    """
+    Push (n_samples, n_chan) data to `outlet` chunk by chunk on the
+    schedule of chunk_schedule() until the data ends (or forever with
+    loop=True, or until the `stop` event is set). timestamps: the
+    recording's per-sample timestamps, to replay its original timing.
+    speed=None replays as fast as possible.
+
+    jitter: maximum random delay of a push, seconds (the schedule itself
+    does not drift). dropout: probability that a chunk starts a dropout of
+    dropout_chunks[0]..dropout_chunks[1] chunks. Counters are kept in
+    `stats` (a new dict if None), which is also returned.
+    """
+    from pylsl import local_clock
+
+    rng = np.random.default_rng(seed)
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    if len(data) < chunk and timestamps is None:
+        raise ValueError(f"Need at least {chunk} samples to replay, got {len(data)}.")
+    bounds, offsets, duration = chunk_schedule(len(data), fs, chunk, timestamps)
+    if stats is None:
+        stats = {}
+    stats.update(pushed=0, dropped=0, late=0, loops=0)
+    late_after = chunk / fs
+    t0 = local_clock()
+    skip = 0
+    while stop is None or not stop.is_set():
+        start = t0 + stats['loops'] * duration / (speed or 1)
+        for k in range(len(offsets)):
+            if stop is not None and stop.is_set():
+                break
+            if speed:
+                due = start + offsets[k] / speed + (rng.uniform(0, jitter) if jitter else 0.0)
+                wait = due - local_clock()
+                if wait > 0:
+                    time.sleep(wait)
+                elif wait < -late_after:
+                    stats['late'] += 1
+            n = bounds[k + 1] - bounds[k]
+            if skip == 0 and dropout and rng.random() < dropout:
+                skip = int(rng.integers(dropout_chunks[0], dropout_chunks[1] + 1))
+            if skip:
+                skip -= 1
+                stats['dropped'] += n
+                continue
+            outlet.push_chunk(data[bounds[k]:bounds[k + 1]])
+            stats['pushed'] += n
+        stats['loops'] += 1
+        if not loop:
+            break
+    return stats
+
+
+def start_replay(data, fs, outlet, **kwargs):
+    """Run replay() on a daemon thread; returns (thread, stop event)."""
+    stop = threading.Event()
+    thread = threading.Thread(target=replay, args=(data, fs, outlet), kwargs=dict(kwargs, stop=stop),
+                              daemon=True)
+    thread.start()
+    return thread, stop
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recording (or synthetic EEG) as an LSL stream.")
+    parser.add_argument("recording", nargs="?", help=".csv or .xdf file")
+    parser.add_argument("--synthetic", type=int, metavar="N_CHAN", help="stream synthetic EEG with N_CHAN channels")
+    parser.add_argument("--fs", type=float, help="sample rate (CSV without Time column, or synthetic; default 256)")
+    parser.add_argument("--name", default="Replay", help="LSL stream name")
+    parser.add_argument("--type", default="EEG", help="LSL stream type")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SAMPLES,
+                        help="samples per push (most per push when following XDF timestamps)")
+    parser.add_argument("--nominal", action="store_true",
+                        help="ignore XDF timestamps and push at the nominal rate")
+    parser.add_argument("--speed", default="1", help="replay speed factor, or 'max'")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max random delay per push (s)")
+    parser.add_argument("--dropout", type=float, default=0.0, help="probability a chunk starts a dropout")
+    parser.add_argument("--once", action="store_true", help="stop at the end instead of looping")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    timestamps = None
+    if args.synthetic:
+        fs = args.fs or 256
+        channels = [f"ch{i}" for i in range(args.synthetic)]
+        data = synthetic_eeg(60.0, fs=fs, n_chan=args.synthetic, seed=args.seed)
+    elif args.recording and args.recording.lower().endswith(".xdf") and not args.nominal:
+        data, fs, channels, _, timestamps = load_xdf(args.recording, args.type)
+    elif args.recording:
+        recording = open_recording(args.recording, fs=args.fs)
+        fs, channels = recording.fs, recording.channels
+        data = np.concatenate(list(recording.iter_blocks(channels)))
+    else:
+        parser.error("give a recording or --synthetic N_CHAN")
+    speed = None if args.speed == "max" else float(args.speed)
+
+    outlet = make_outlet(args.name, fs, channels, args.type, chunk=args.chunk)
+    print(f"Streaming '{args.name}' ({args.type}): {len(channels)} channels at {fs:g} Hz, "
+          f"speed {args.speed if speed is None else f'{speed:g}x'}, {len(data) / fs:.1f}s of data{'' if args.once else ' (looped)'}"
+          f"{', recorded timing' if timestamps is not None else ''} ... (Ctrl-C to stop)")
+    t_start = time.perf_counter()
+    stats = {}
+    try:
+        replay(data, fs, outlet, args.chunk, speed, args.jitter, args.dropout,
+               loop=not args.once, seed=args.seed, stats=stats, timestamps=timestamps)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - t_start
+    if stats:
+        print(f"Pushed {stats['pushed']} samples ({stats['pushed'] / elapsed:.0f}/s), "
+              f"dropped {stats['dropped']}, late pushes {stats['late']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
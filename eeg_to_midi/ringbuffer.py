@@ -0,0 +1,66 @@
+# ringbuffer.py
+"""
+Fixed-size multi-channel ring buffer for live EEG.
+
+Storage is one preallocated (2 * capacity, n_chan) array. Every sample is
+written twice, at row i and row i + capacity, so the newest N samples are
+always one contiguous slice: latest(N) is a zero-copy view, with no
+per-sample Python objects and no np.array(deque) rebuild.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity, n_chan=1, dtype=np.float64):
+        self.capacity = int(capacity)
+        self.n_chan = int(n_chan)
+        self._data = np.zeros((2 * self.capacity, self.n_chan), dtype=dtype)
+        self._pos = 0           # next write row, 0 <= _pos < capacity
+        self.count = 0          # valid samples, saturates at capacity
+        self.total = 0          # samples ever written
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_full(self):
+        return self.count == self.capacity
+
+    def extend(self, chunk):
+        """Append a (n_samples, n_chan) block (or (n_samples,) for one channel)."""
+        chunk = np.asarray(chunk)
+        if chunk.ndim == 1:
+            chunk = chunk.reshape(-1, 1) if self.n_chan == 1 else chunk.reshape(1, -1)
+        n = len(chunk)
+        if n == 0:
+            return
+        self.total += n
+        if n >= self.capacity:
+            # Only the newest `capacity` samples survive
+            chunk = chunk[-self.capacity:]
+            self._data[:self.capacity] = chunk
+            self._data[self.capacity:] = chunk
+            self._pos = 0
+            self.count = self.capacity
+            return
+        cap, pos = self.capacity, self._pos
+        first = min(n, cap - pos)
+        self._data[pos:pos + first] = chunk[:first]
+        self._data[pos + cap:pos + cap + first] = chunk[:first]
+        if first < n:
+            rest = n - first
+            self._data[:rest] = chunk[first:]
+            self._data[cap:cap + rest] = chunk[first:]
+        self._pos = (pos + n) % cap
+        self.count = min(cap, self.count + n)
+
+    def latest(self, n=None):
+        """Zero-copy (n, n_chan) view of the newest n samples, oldest first."""
+        n = self.count if n is None else min(int(n), self.count)
+        end = self._pos + self.capacity
+        return self._data[end - n:end]
+
+    def clear(self):
+        self._pos = 0
+        self.count = 0
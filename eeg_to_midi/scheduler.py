@@ -0,0 +1,186 @@
+# scheduler.py
+"""
+Event scheduler that owns MIDI output.
+
+Analysis code hands it (deadline, message) pairs and carries on; a background
+thread sends each message when its absolute deadline arrives. Deadlines are on
+the scheduler's clock (time.perf_counter by default), so notes from any number
+of bands/channels can overlap without anyone calling time.sleep().
+
+Every sent event records its lateness (send time - deadline), which is the
+number to watch when playback starts falling behind.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from functools import partial
+
+import mido
+
+from .latency import LatencyHistogram
+
+
+class EventScheduler:
+    """
+    Priority queue of timed MIDI events with a single sender thread.
+
+    port           : anything with .send(msg) (mido output port)
+    clock          : monotonic clock in seconds
+    late_threshold : events later than this (s) are counted as late
+    """
+
+    def __init__(self, port, clock=time.perf_counter, late_threshold=0.005):
+        self.port = port
+        self.clock = clock
+        self.late_threshold = late_threshold
+        self.lateness = LatencyHistogram()   # bounded, so hours of playback cost no memory
+        self.late_events = 0
+        self._late_sum = 0.0
+        self._heap = []
+        self._seq = itertools.count()   # keeps insertion order for equal deadlines
+        self._cv = threading.Condition()
+        self._active_notes = set()
+        self._running = False
+        self._thread = None
+
+    def now(self):
+        return self.clock()
+
+    # ---- producer side ----
+    def schedule(self, deadline, item):
+        """
+        Queue `item` for an absolute `deadline` on self.clock.
+        item is a mido.Message (sent to the port) or a callable (called with
+        no arguments, e.g. for logging in time with the music).
+        """
+        with self._cv:
+            heapq.heappush(self._heap, (deadline, next(self._seq), item))
+            # Wake the sender in case this is now the earliest deadline
+            self._cv.notify()
+
+    def schedule_events(self, events, t0):
+        """Queue (time_sec, item) pairs relative to the absolute time t0."""
+        with self._cv:
+            for t, item in events:
+                heapq.heappush(self._heap, (t0 + t, next(self._seq), item))
+            self._cv.notify()
+
+    def pending(self):
+        with self._cv:
+            return len(self._heap)
+
+    # ---- sender thread ----
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="midi-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while self._running:
+                    if not self._heap:
+                        self._cv.wait()
+                        continue
+                    delay = self._heap[0][0] - self.clock()
+                    if delay <= 0:
+                        break
+                    self._cv.wait(timeout=delay)
+                if not self._running:
+                    return
+                deadline, _, item = heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cv.notify_all()   # wake wait_until_idle()
+            # Send outside the lock so producers never block on a slow port
+            self._dispatch(item, deadline)
+
+    def _dispatch(self, item, deadline):
+        if callable(item):
+            item()
+            return
+        self.port.send(item)
+        late = self.clock() - deadline
+        self.lateness.record(late)
+        self._late_sum += late
+        if late > self.late_threshold:
+            self.late_events += 1
+        key = (getattr(item, 'channel', 0), getattr(item, 'note', None))
+        if item.type == 'note_on' and item.velocity > 0:
+            self._active_notes.add(key)
+        elif item.type in ('note_on', 'note_off'):
+            self._active_notes.discard(key)
+
+    # ---- shutdown ----
+    def wait_until_idle(self, timeout=None):
+        """Block until every queued event has been dispatched."""
+        with self._cv:
+            return self._cv.wait_for(lambda: not self._heap, timeout=timeout)
+
+    def stop(self, release_notes=True):
+        """
+        Stop the sender thread and drop anything still queued. With
+        release_notes, a note_off is sent for every note left sounding.
+        """
+        with self._cv:
+            self._running = False
+            self._heap.clear()
+            self._cv.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if release_notes:
+            for channel, note in sorted(self._active_notes):
+                self.port.send(mido.Message('note_off', note=note, velocity=0, channel=channel))
+            self._active_notes.clear()
+
+    # ---- reporting ----
+    def stats(self):
+        """Lateness summary in milliseconds."""
+        n = self.lateness.count
+        return {'events': n, 'late': self.late_events,
+                'mean_ms': self._late_sum / n * 1000 if n else 0.0,
+                'p99_ms': self.lateness.percentile(99) * 1000,
+                'max_ms': self.lateness.max * 1000}
+
+    def reset_stats(self):
+        self.lateness.reset()
+        self.late_events = 0
+        self._late_sum = 0.0
+
+    def report(self):
+        s = self.stats()
+        print(f"Scheduler: {s['events']} events | late={s['late']} | "
+              f"mean={s['mean_ms']:.2f}ms | p99={s['p99_ms']:.2f}ms | max={s['max_ms']:.2f}ms")
+
+
+class PlaybackSink:
+    """
+    Plays events live through an EventScheduler as they are produced.
+    Event times are seconds from the moment the sink was created.
+    Same interface as render.MidiFileSink.
+    """
+
+    def __init__(self, port, lead=0.05):
+        self.port = port
+        self.scheduler = EventScheduler(port).start()
+        self.t0 = self.scheduler.now() + lead   # small lead so the first notes are not late
+
+    def add(self, events):
+        self.scheduler.schedule_events(events, self.t0)
+
+    def log(self, t, text):
+        """Print `text` when playback reaches time t."""
+        self.scheduler.schedule(self.t0 + t, partial(print, text))
+
+    def finish(self):
+        self.scheduler.wait_until_idle()
+
+    def close(self):
+        self.scheduler.stop()
+        self.scheduler.report()
+        self.port.close()
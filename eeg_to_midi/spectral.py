@@ -0,0 +1,218 @@
+# spectral.py
+"""
+Band-power engine: one PSD per window, every band and channel at once.
+
+The frequency grid only depends on (fs, nperseg), so the band selections are
+turned into a (n_bands x n_freqs) weight matrix up front. Reducing a PSD to
+band powers is then a single matrix product instead of one welch() per band.
+
+The PSD itself is Welch's method (periodic Hann window, per-segment mean
+removal, 50% overlap, density scaling, as scipy.signal.welch defaults) done
+as one batched rFFT over every segment of every frame, so a whole block of
+(possibly overlapping) windows costs a single numpy call and scipy is not
+needed at all.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .ringbuffer import RingBuffer
+
+# Same bands the multiband bridge has always used
+EEG_BANDS = {
+    'delta': (0.5, 4),
+    'theta': (4, 8),
+    'alpha': (8, 12),
+    'beta':  (12, 30),
+    'gamma': (30, 45)
+}
+
+
+class BandPowerEngine:
+    """
+    Computes power in several frequency bands from a single Welch PSD.
+
+    bands   : dict name -> (fmin, fmax) or a single (fmin, fmax) tuple
+    nperseg : Welch segment length (the window length for a single segment)
+    reduce  : "mean" -> mean PSD inside the band (prerecorded bridges)
+              "trapz" -> PSD integrated over the band (live bridges)
+    """
+
+    def __init__(self, fs, nperseg, bands=EEG_BANDS, reduce="mean"):
+        if isinstance(bands, tuple):
+            bands = {'band': bands}
+        if reduce not in ("mean", "trapz"):
+            raise ValueError(f"Unknown reduce mode: {reduce!r}")
+        self.fs = float(fs)
+        self.nperseg = int(nperseg)
+        self.band_names = list(bands)
+        self.bands = [bands[name] for name in self.band_names]
+        self.reduce = reduce
+        self.freqs = np.fft.rfftfreq(self.nperseg, d=1.0 / self.fs)
+        self.slices = [self._band_slice(band) for band in self.bands]
+        self.weights = self._weight_matrix()
+        # Welch constants: periodic Hann window, density scale, 50% overlap
+        self.window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.nperseg) / self.nperseg)
+        self.scale = 1.0 / (self.fs * np.sum(self.window ** 2))
+        self.step = self.nperseg - self.nperseg // 2
+
+    def _band_slice(self, band):
+        # freqs are sorted, so each band is one contiguous run of bins
+        lo = np.searchsorted(self.freqs, band[0], side='left')
+        hi = np.searchsorted(self.freqs, band[1], side='right')
+        return slice(lo, hi)
+
+    def _weight_matrix(self):
+        weights = np.zeros((len(self.bands), len(self.freqs)))
+        df = self.freqs[1] - self.freqs[0] if len(self.freqs) > 1 else 0.0
+        for b, sl in enumerate(self.slices):
+            n = sl.stop - sl.start
+            if n == 0:
+                continue
+            if self.reduce == "mean":
+                weights[b, sl] = 1.0 / n
+            elif n > 1:
+                # trapezoid rule on an evenly spaced grid
+                weights[b, sl] = df
+                weights[b, sl.start] = weights[b, sl.stop - 1] = df / 2
+        return weights
+
+    def psd(self, x, axis=0):
+        """Welch PSD of x along `axis` (frequency replaces that axis)."""
+        x = np.moveaxis(np.asarray(x, dtype=float), axis, -1)
+        if x.shape[-1] == self.nperseg:
+            segments = x[..., None, :]      # one segment: the usual case for analysis windows
+        else:
+            segments = sliding_window_view(x, self.nperseg, axis=-1)[..., ::self.step, :]
+        segments = segments - segments.mean(axis=-1, keepdims=True)
+        spectrum = np.fft.rfft(segments * self.window, axis=-1)
+        pxx = (spectrum.real ** 2 + spectrum.imag ** 2) * self.scale
+        # one-sided: double everything but DC (and Nyquist for even lengths)
+        pxx[..., 1:len(self.freqs) - (self.nperseg % 2 == 0)] *= 2
+        return np.moveaxis(pxx.mean(axis=-2), -1, axis)
+
+    def from_psd(self, pxx, axis=0):
+        """Reduce a PSD to band powers; the frequency axis becomes the band axis."""
+        pxx = np.moveaxis(pxx, axis, 0)
+        out = np.tensordot(self.weights, pxx, axes=(1, 0))
+        return np.moveaxis(out, 0, axis)
+
+    def compute(self, x, axis=0):
+        """
+        Band powers of x. The time axis (`axis`) is replaced by the band axis,
+        so a (n_samples, n_chan) window gives (n_bands, n_chan).
+        """
+        x = np.asarray(x, dtype=float)
+        if x.shape[axis] < self.nperseg:
+            raise ValueError(f"Need {self.nperseg} samples, got {x.shape[axis]}")
+        return self.from_psd(self.psd(x, axis=axis), axis=axis)
+
+
+def frame_starts(n_samples, window_size, hop=None):
+    """Start index of every complete window, `hop` samples apart (default: window_size, no overlap)."""
+    hop = int(hop or window_size)
+    return np.arange(0, max(0, n_samples - window_size + 1), hop)
+
+
+def frame_windows(x, window_size, hop=None):
+    """
+    Zero-copy (n_windows, window_size, ...) view of x, one frame per entry of
+    frame_starts(); frames overlap when hop < window_size. Pass it to
+    BandPowerEngine.compute(..., axis=1).
+    """
+    x = np.asarray(x)
+    if len(x) < window_size:
+        return np.empty((0, window_size) + x.shape[1:], dtype=x.dtype)
+    view = sliding_window_view(x, window_size, axis=0)
+    # sliding_window_view puts the window axis last; move it next to the frame axis
+    view = np.moveaxis(view, -1, 1)
+    return view[::int(hop or window_size)]
+
+
+class SlidingBandPower:
+    """
+    Incremental band power over the newest `n_samples` samples.
+
+    A sliding DFT tracks only the bins the bands need (plus one neighbour on
+    each side), so each update costs O(new samples x tracked bins) instead of
+    a full FFT per hop. Mean removal and the Hann window are applied in the
+    frequency domain, which makes the result match
+    BandPowerEngine(fs, n_samples, bands, reduce).compute(window), i.e. a
+    single-segment Welch PSD with nperseg == n_samples.
+
+    The recurrence accumulates rounding error, so the tracked bins are
+    recomputed exactly from the stored window every `resync_every` samples.
+    """
+
+    def __init__(self, fs, n_samples, bands=EEG_BANDS, n_chan=1, reduce="mean", resync_every=None):
+        self.engine = BandPowerEngine(fs, n_samples, bands, reduce)
+        self.n_samples = N = int(n_samples)
+        self.n_chan = int(n_chan)
+        self.resync_every = int(resync_every or 10 * N)
+        self.band_names = self.engine.band_names
+
+        # Bins with non-zero weight in any band, and their Hann neighbours
+        self.band_bins = np.flatnonzero(np.any(self.engine.weights != 0, axis=0))
+        neighbours = (self.band_bins[:, None] + np.array([-1, 0, 1])) % N
+        self.bins, pos = np.unique(neighbours, return_inverse=True)
+        pos = pos.reshape(-1, 3)
+        self._prev, self._centre, self._next = pos[:, 0], pos[:, 1], pos[:, 2]
+        self._is_dc = self.bins == 0
+
+        self._twiddle = np.exp(2j * np.pi * self.bins / N)    # w_k = e^{j2pi k/N}
+        self._twiddle_cache = {}
+        # Welch 'density' scaling for a periodic Hann window, one-sided
+        hann = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N) / N)
+        scale = np.full(len(self.band_bins), 2.0 / (self.engine.fs * np.sum(hann ** 2)))
+        scale[self.band_bins == 0] /= 2
+        if N % 2 == 0:
+            scale[self.band_bins == N // 2] /= 2
+        self._scale = scale[:, None]
+        self._weights = self.engine.weights[:, self.band_bins]
+
+        # History starts as zeros, so the estimate is defined from the first sample
+        self._window = RingBuffer(N, self.n_chan)
+        self._window.extend(np.zeros((N, self.n_chan)))
+        self._X = np.zeros((len(self.bins), self.n_chan), dtype=complex)
+        self.total = 0
+        self._since_resync = 0
+
+    @property
+    def is_full(self):
+        """True once a whole window of real samples has been seen."""
+        return self.total >= self.n_samples
+
+    def _twiddles(self, m):
+        # W[k, i] = w_k^(m - i): contribution of the i-th new sample after m steps
+        if m not in self._twiddle_cache:
+            exps = m - np.arange(m)
+            self._twiddle_cache[m] = np.exp(2j * np.pi * np.outer(self.bins, exps) / self.n_samples)
+        return self._twiddle_cache[m]
+
+    def resync(self):
+        """Recompute the tracked bins exactly from the stored window."""
+        window = self._window.latest()
+        self._X = np.fft.fft(window, axis=0)[self.bins]
+        self._since_resync = 0
+
+    def update(self, chunk):
+        """Push new samples ((m,) or (m, n_chan)) and return band powers (n_bands, n_chan)."""
+        chunk = np.asarray(chunk, dtype=float).reshape(-1, self.n_chan)
+        m = len(chunk)
+        if m:
+            self.total += m
+            self._since_resync += m
+            if m >= self.n_samples or self._since_resync >= self.resync_every:
+                self._window.extend(chunk)
+                self.resync()
+            else:
+                diff = chunk - self._window.latest()[:m]   # incoming - outgoing samples
+                self._window.extend(chunk)
+                self._X = (self._twiddle ** m)[:, None] * self._X + self._twiddles(m) @ diff
+        return self.band_powers()
+
+    def band_powers(self):
+        X = np.where(self._is_dc[:, None], 0, self._X)          # detrend='constant'
+        Xh = 0.5 * X[self._centre] - 0.25 * (X[self._prev] + X[self._next])   # Hann
+        psd = (Xh.real ** 2 + Xh.imag ** 2) * self._scale
+        return self._weights @ psd
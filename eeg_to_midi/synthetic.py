@@ -0,0 +1,51 @@
+# synthetic.py
+"""
+Synthetic multi-channel EEG for benchmarks and hardware-free testing.
+
+Pink (1/f) background noise plus alpha and beta bursts that switch on and
+off at random, so band powers move the way real recordings do.
+"""
+
+import numpy as np
+
+
+def pink_noise(n_samples, n_chan, rng):
+    """1/f noise per channel, unit variance (spectral shaping of white noise)."""
+    spectrum = np.fft.rfft(rng.standard_normal((n_samples, n_chan)), axis=0)
+    freqs = np.fft.rfftfreq(n_samples)
+    freqs[0] = freqs[1] if len(freqs) > 1 else 1.0
+    spectrum /= np.sqrt(freqs)[:, None]
+    x = np.fft.irfft(spectrum, n=n_samples, axis=0)
+    return x / (x.std(axis=0, keepdims=True) + 1e-12)
+
+
+def _bursts(n_samples, n_chan, fs, freq_range, rate, duration, rng):
+    # Random sinusoidal bursts (Hann envelope), independent per channel
+    out = np.zeros((n_samples, n_chan))
+    burst_len = max(2, int(duration * fs))
+    envelope = np.hanning(burst_len)
+    n_bursts = rng.poisson(rate * n_samples / fs * n_chan)
+    for _ in range(n_bursts):
+        ch = rng.integers(n_chan)
+        start = rng.integers(0, max(1, n_samples - burst_len))
+        seg = min(burst_len, n_samples - start)
+        t = np.arange(seg) / fs
+        freq = rng.uniform(*freq_range)
+        out[start:start + seg, ch] += envelope[:seg] * np.sin(2 * np.pi * freq * t + rng.uniform(0, 2 * np.pi))
+    return out
+
+
+def synthetic_eeg(duration_sec, fs=256, n_chan=4, alpha_amp=3.0, beta_amp=1.5,
+                  burst_rate=0.5, burst_sec=1.0, noise_amp=10.0, seed=0, dtype=np.float32):
+    """
+    (n_samples, n_chan) array of fake EEG in microvolt-ish units.
+
+    alpha_amp / beta_amp : burst amplitude relative to the noise level
+    burst_rate           : bursts per second per channel, for each band
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(duration_sec * fs)
+    x = pink_noise(n_samples, n_chan, rng)
+    x += alpha_amp * _bursts(n_samples, n_chan, fs, (8, 12), burst_rate, burst_sec, rng)
+    x += beta_amp * _bursts(n_samples, n_chan, fs, (13, 30), burst_rate, burst_sec / 2, rng)
+    return (noise_amp * x).astype(dtype)
@@ -0,0 +1,326 @@
+# trace.py
+"""
+Per-window trace of a live bridge, for finding out afterwards why it stuttered.
+
+    python -m eeg_to_midi.trace session.trace                     # summary
+    python -m eeg_to_midi.trace session.trace --chrome trace.json # open in chrome://tracing or Perfetto
+
+Tracer records one fixed-size row per stream per analysed window (time,
+samples pulled, loop duration, band power per channel, MIDI events emitted,
+artifact flag) and one row per MIDI message, into preallocated numpy
+buffers. Recording is a single row assignment, without formatting or I/O.
+Every `flush_sec` seconds, or when a buffer fills, the buffer is swapped
+for a free preallocated one and a background thread appends the full one to
+the trace file as raw records. If the writer ever falls behind so far that
+no buffer is free, rows are dropped and counted, but the loop never waits.
+
+File layout: a magic line, one JSON header line (the record dtypes and
+stream names), then blocks of b"W" or b"M" + uint32 count + raw records.
+
+SamplingProfiler is an optional sampling profiler: a thread that looks at
+the main thread's stack every few milliseconds and counts the stacks, then
+writes them in the "folded" format that flamegraph.pl and speedscope read.
+It can be switched on and off with a signal while the bridge runs.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+MAGIC = b"EEGTRACE1\n"
+CAPACITY = 4096         # rows per buffer
+SPARES = 3              # extra buffers per record type for the writer to work through
+FLUSH_SEC = 5.0
+
+# MIDI message kinds in the event records
+MIDI_KINDS = ('note_off', 'note_on', 'control_change', 'other')
+
+
+def window_dtype(max_chan):
+    return np.dtype([('t', 'f8'), ('loop_sec', 'f4'), ('stream', 'u2'), ('samples', 'u4'),
+                     ('events', 'u2'), ('artifact', 'u1'), ('power', 'f4', (max_chan,))])
+
+
+MIDI_DTYPE = np.dtype([('t', 'f8'), ('stream', 'u2'), ('kind', 'u1'), ('channel', 'u1'),
+                       ('number', 'u1'), ('value', 'u1')])
+
+
+class _Buffer:
+    """The record array being filled, and free ones to swap in when it goes to the writer."""
+
+    def __init__(self, dtype, capacity, spares=SPARES):
+        self.rows = np.zeros(capacity, dtype=dtype)
+        self.free = [np.zeros(capacity, dtype=dtype) for _ in range(spares)]
+        self.n = 0
+
+
+class Tracer:
+    """
+    Preallocated in-memory trace, flushed to `path` from a background thread
+    (path=None keeps only the latest buffer in memory).
+
+    max_chan : band power values kept per row (channels beyond are not traced)
+    streams  : stream names, stored in the header
+
+    Row times are whatever clock the caller uses (pylsl.local_clock in the
+    bridges, so they line up with sample timestamps).
+    """
+
+    def __init__(self, path=None, max_chan=8, streams=(), capacity=CAPACITY, flush_sec=FLUSH_SEC):
+        self.path = path
+        self.max_chan = max_chan
+        self.flush_sec = flush_sec
+        self.windows = _Buffer(window_dtype(max_chan), capacity)
+        self.midi = _Buffer(MIDI_DTYPE, capacity)
+        self.dropped = 0
+        self.written = 0
+        self._power = np.empty(max_chan, dtype=np.float32)   # scratch row for short power vectors
+        self._last_flush = time.monotonic()
+        self._pending = []          # (tag, buffer, rows, n) handed to the writer
+        self._cv = threading.Condition()
+        self._running = True
+        self._file = None
+        self._thread = None
+        if path is not None:
+            self._file = open(path, 'wb')
+            header = {'window': window_dtype(max_chan).descr, 'midi': MIDI_DTYPE.descr,
+                      'streams': list(streams), 'midi_kinds': MIDI_KINDS, 'created': time.time()}
+            self._file.write(MAGIC + json.dumps(header).encode() + b"\n")
+            self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+            self._thread.start()
+
+    # ---- recording (main loop) ----
+    def window(self, t, stream, samples, loop_sec, events=0, artifact=False, power=None):
+        """One analysed window of `stream`; power is its band power per channel (or None)."""
+        buf = self.windows
+        if buf.n == len(buf.rows):
+            self._swap(b"W", buf)
+        if power is None or len(power) != self.max_chan:
+            n = 0 if power is None else min(len(power), self.max_chan)
+            self._power[:] = np.nan
+            self._power[:n] = power[:n] if n else ()
+            power = self._power
+        buf.rows[buf.n] = (t, loop_sec, stream, samples, events, artifact, power)
+        buf.n += 1
+
+    def midi_message(self, t, stream, msg):
+        buf = self.midi
+        if buf.n == len(buf.rows):
+            self._swap(b"M", buf)
+        if msg.type == 'control_change':
+            row = (t, stream, 2, msg.channel, msg.control, msg.value)
+        elif msg.type in ('note_on', 'note_off'):
+            on = msg.type == 'note_on' and msg.velocity > 0
+            row = (t, stream, int(on), msg.channel, msg.note, msg.velocity)
+        else:
+            row = (t, stream, 3, getattr(msg, 'channel', 0), 0, 0)
+        buf.rows[buf.n] = row
+        buf.n += 1
+
+    def maybe_flush(self):
+        """Hand full-enough buffers to the writer every flush_sec seconds."""
+        if time.monotonic() - self._last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        self._swap(b"W", self.windows)
+        self._swap(b"M", self.midi)
+        self._last_flush = time.monotonic()
+
+    def _swap(self, tag, buf):
+        if buf.n == 0:
+            return
+        if self._file is None:
+            buf.n = 0       # memory only: start over
+            return
+        with self._cv:
+            if not buf.free:
+                # The writer still holds every spare: drop rather than wait
+                self.dropped += buf.n
+                buf.n = 0
+                return
+            self._pending.append((tag, buf, buf.rows, buf.n))
+            buf.rows = buf.free.pop()
+            buf.n = 0
+            self._cv.notify()
+
+    # ---- writer thread ----
+    def _run(self):
+        while True:
+            with self._cv:
+                while self._running and not self._pending:
+                    self._cv.wait()
+                if not self._pending:
+                    return
+                tag, buf, rows, n = self._pending.pop(0)
+            self._file.write(tag + np.uint32(n).tobytes() + rows[:n].tobytes())
+            self.written += n
+            with self._cv:
+                buf.free.append(rows)
+                self._cv.notify_all()
+
+    def close(self):
+        """Write what is left and close the file."""
+        if self._file is None:
+            return
+        self.flush()
+        with self._cv:
+            self._running = False   # the writer empties its queue before it exits
+            self._cv.notify_all()
+        self._thread.join()
+        self._file.close()
+        self._file = None
+
+
+# ---- reading ----
+def read_trace(path):
+    """(header, window records, MIDI records) of a trace file."""
+    with open(path, 'rb') as f:
+        if f.readline() != MAGIC:
+            raise ValueError(f"{path} is not an eeg_to_midi trace")
+        header = json.loads(f.readline())
+        dtypes = {b"W": np.dtype([tuple(d) for d in header['window']]),
+                  b"M": np.dtype([tuple(d) for d in header['midi']])}
+        parts = {b"W": [], b"M": []}
+        while True:
+            head = f.read(5)
+            if len(head) < 5:
+                break
+            tag, n = head[:1], int(np.frombuffer(head[1:], dtype=np.uint32)[0])
+            data = f.read(n * dtypes[tag].itemsize)
+            parts[tag].append(np.frombuffer(data, dtype=dtypes[tag], count=len(data) // dtypes[tag].itemsize))
+    windows, midi = (np.concatenate(parts[tag]) if parts[tag] else np.zeros(0, dtypes[tag]) for tag in (b"W", b"M"))
+    return header, windows, midi
+
+
+def to_chrome(header, windows, midi):
+    """Chrome trace events: a slice per window (one track per stream), a power counter and MIDI instants."""
+    names = header.get('streams') or []
+    t0 = min(windows['t'][:1].tolist() + midi['t'][:1].tolist() or [0.0])
+    events = [{'ph': 'M', 'name': 'thread_name', 'pid': 1, 'tid': i, 'args': {'name': name}}
+              for i, name in enumerate(names)]
+    for w in windows:
+        ts, dur = float(w['t'] - t0) * 1e6, float(w['loop_sec']) * 1e6
+        power = [float(p) for p in w['power'] if np.isfinite(p)]
+        events.append({'ph': 'X', 'name': 'artifact' if w['artifact'] else 'window', 'pid': 1,
+                       'tid': int(w['stream']), 'ts': ts - dur, 'dur': dur,
+                       'args': {'samples': int(w['samples']), 'events': int(w['events']), 'power': power}})
+        if power:
+            events.append({'ph': 'C', 'name': f"power {int(w['stream'])}", 'pid': 1, 'ts': ts,
+                           'args': {f"ch{c}": p for c, p in enumerate(power)}})
+    kinds = header.get('midi_kinds', MIDI_KINDS)
+    for m in midi:
+        events.append({'ph': 'i', 's': 't', 'name': kinds[m['kind']], 'pid': 1, 'tid': int(m['stream']),
+                       'ts': float(m['t'] - t0) * 1e6,
+                       'args': {'channel': int(m['channel']), 'number': int(m['number']), 'value': int(m['value'])}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def summarize(header, windows, midi):
+    lines = [f"{len(windows)} windows, {len(midi)} MIDI messages"]
+    names = header.get('streams') or []
+    for s in np.unique(windows['stream']):
+        w = windows[windows['stream'] == s]
+        loop_ms = w['loop_sec'] * 1e3
+        name = names[s] if s < len(names) else f"stream {s}"
+        span = w['t'][-1] - w['t'][0] if len(w) > 1 else 0.0
+        lines.append(f"{name}: {len(w)} windows over {span:.1f}s, {int(w['samples'].sum())} samples, "
+                     f"{int(w['events'].sum())} events, {int(w['artifact'].sum())} artifacts | loop "
+                     f"p50={np.percentile(loop_ms, 50):.2f}ms p99={np.percentile(loop_ms, 99):.2f}ms "
+                     f"max={loop_ms.max():.2f}ms")
+        gaps = np.diff(w['t'])
+        if len(gaps):
+            worst = np.argmax(gaps)
+            lines.append(f"   longest gap between windows: {gaps[worst] * 1e3:.1f}ms at t={w['t'][worst + 1]:.3f}")
+    return "\n".join(lines)
+
+
+# ---- sampling profiler ----
+class SamplingProfiler:
+    """
+    Samples the stack of `thread_id` (default: the thread that creates it)
+    every `interval` seconds from a background thread. Costs nothing while
+    stopped; while running, one stack walk per sample.
+    """
+
+    def __init__(self, path="profile.folded", interval=0.005, thread_id=None):
+        self.path = path
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """Stop sampling and write the folded stacks to self.path."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with open(self.path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Profiler: {self.samples} samples -> {self.path}")
+
+    def toggle(self, *_):
+        """Start if stopped, stop (and write) if running; usable as a signal handler."""
+        self.stop() if self.running else self.start()
+
+    def install_toggle(self, signum=None):
+        """Toggle on a signal (SIGUSR1 by default, where the platform has it)."""
+        import signal
+
+        signum = signum or getattr(signal, 'SIGUSR1', None)
+        if signum is not None:
+            signal.signal(signum, self.toggle)
+        return signum
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m eeg_to_midi.trace", description="Inspect a live bridge trace.")
+    parser.add_argument("trace", help="trace file written by a bridge (TRACE_FILE)")
+    parser.add_argument("--chrome", help="write a Chrome trace (JSON) for chrome://tracing or ui.perfetto.dev")
+    args = parser.parse_args(argv)
+
+    header, windows, midi = read_trace(args.trace)
+    print(summarize(header, windows, midi))
+    if args.chrome:
+        with open(args.chrome, 'w') as f:
+            json.dump(to_chrome(header, windows, midi), f)
+        print(f"Chrome trace -> {args.chrome}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,126 @@
+# viewer.py
+"""
+Live plot that runs in its own process, off the MIDI hot path.
+
+The bridge writes values into a shared-memory ring (PlotFeed.push is a couple
+of array stores, no locks, no drawing). A separate viewer process reads the
+newest values at its own capped frame rate. If it falls behind it simply
+skips to the latest data, so a slow redraw never delays MIDI output.
+
+Run directly by PlotFeed.start(); matplotlib is only imported in the viewer.
+"""
+
+import argparse
+import subprocess
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_HEADER = 2     # [samples written, stop flag] stored as float64 ahead of the data
+
+
+def _attach(name, n_series, length):
+    shm = shared_memory.SharedMemory(name=name)
+    buf = np.ndarray((_HEADER + n_series * length,), dtype=np.float64, buffer=shm.buf)
+    return shm, buf[:_HEADER], buf[_HEADER:].reshape(n_series, length)
+
+
+class PlotFeed:
+    """
+    Producer side of the viewer.
+
+    labels : one legend entry per series (push() takes values in this order)
+    length : points shown on screen
+    fps    : viewer frame-rate cap
+    """
+
+    def __init__(self, labels, length=200, ylim=(0, 130), fps=20, title="EEG -> MIDI"):
+        self.labels = list(labels)
+        self.length = int(length)
+        self.ylim = ylim
+        self.fps = fps
+        self.title = title
+        n_bytes = 8 * (_HEADER + len(self.labels) * self.length)
+        self._shm = shared_memory.SharedMemory(create=True, size=n_bytes)
+        buf = np.ndarray((n_bytes // 8,), dtype=np.float64, buffer=self._shm.buf)
+        buf[:] = 0.0
+        self._header = buf[:_HEADER]
+        self._data = buf[_HEADER:].reshape(len(self.labels), self.length)
+        self._count = 0
+        self._proc = None
+
+    def start(self):
+        cmd = [sys.executable, __file__, self._shm.name, str(len(self.labels)), str(self.length),
+               "--fps", str(self.fps), "--ylim", str(self.ylim[0]), str(self.ylim[1]),
+               "--title", self.title, "--labels", *self.labels]
+        self._proc = subprocess.Popen(cmd)
+        return self
+
+    def push(self, *values):
+        """Record one value per series. Never blocks on the viewer."""
+        self._data[:, self._count % self.length] = values
+        self._count += 1
+        self._header[0] = self._count
+
+    def close(self):
+        self._header[1] = 1.0   # ask the viewer to exit
+        if self._proc is not None:
+            try:
+                self._proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+            self._proc = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+def run_viewer(name, n_series, length, labels, ylim, fps, title):
+    import matplotlib.pyplot as plt
+
+    shm, header, data = _attach(name, n_series, length)
+    if sys.platform != "win32":
+        # The producer owns the segment; don't let this process unlink it on exit
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+    plt.ion()
+    fig, ax = plt.subplots()
+    fig.canvas.manager.set_window_title(title)
+    lines = [ax.plot([], [], label=label)[0] for label in labels]
+    ax.set_ylim(*ylim)
+    ax.set_xlim(0, length)
+    ax.set_xlabel("Samples")
+    ax.set_ylabel("Value")
+    ax.legend()
+
+    last_count = -1
+    try:
+        while header[1] == 0.0 and plt.fignum_exists(fig.number):
+            count = int(header[0])
+            if count != last_count:
+                # Only the newest state is drawn; intermediate frames are dropped
+                n = min(count, length)
+                order = (np.arange(count - n, count)) % length
+                snapshot = data[:, order]
+                for line, ys in zip(lines, snapshot):
+                    line.set_data(np.arange(n), ys)
+                fig.canvas.draw_idle()
+                last_count = count
+            plt.pause(1.0 / fps)
+    finally:
+        del header, data
+        shm.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared-memory live plot for the EEG bridges")
+    parser.add_argument("name")
+    parser.add_argument("n_series", type=int)
+    parser.add_argument("length", type=int)
+    parser.add_argument("--labels", nargs="+", required=True)
+    parser.add_argument("--ylim", nargs=2, type=float, default=(0, 130))
+    parser.add_argument("--fps", type=float, default=20)
+    parser.add_argument("--title", default="EEG -> MIDI")
+    args = parser.parse_args()
+    run_viewer(args.name, args.n_series, args.length, args.labels, args.ylim, args.fps, args.title)
@@ -2,139 +2,245 @@
 """
 EEG -> MIDI bridge: MIDI CC1 changes in parallel with smoothed alpha power
 Combines channels 0-3 alpha power, smooths it, and maps linearly to MIDI CC1
-Dependencies: pylsl, mido, python-rtmidi, numpy, scipy, matplotlib
+Dependencies: pylsl, mido, python-rtmidi, numpy, matplotlib (only with SHOW_PLOT)
 """
 
 import time
+import sys
+from pathlib import Path
 import numpy as np
-from pylsl import StreamInlet, resolve_streams
+from pylsl import local_clock
 import mido
-from collections import deque
-from scipy.signal import welch
-import matplotlib.pyplot as plt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root
+from eeg_to_midi.spectral import BandPowerEngine, SlidingBandPower
+from eeg_to_midi.lsl import MultiInlet, resolve_streams_of_type, stacked_windows
+from eeg_to_midi.latency import LatencyMonitor
+from eeg_to_midi.midi import AsyncMidiOut
+from eeg_to_midi.scheduler import EventScheduler
+from eeg_to_midi.artifacts import default_detector
+from eeg_to_midi.trace import Tracer, SamplingProfiler
+from eeg_to_midi.viewer import PlotFeed
+from eeg_to_midi.normalize import RollingMinMax, QuantileScaler
 
 # ---- CONFIG ----
 LOOPMIDI_PORT_NAME = "EEG_MIDI 1"
+MIDI_FANOUT_PORTS = []   # extra output ports that get a copy of every message
+LSL_STREAM_NAMES = None  # None -> every EEG stream (one per headset); or e.g. ["Muse-A", "Muse-B"]
 SAMPLE_WINDOW_SEC = 1.0
 ALPHA_BAND = (8.0, 12.0)
+BANDPOWER_BACKEND = "welch"  # "welch" (full PSD per chunk) or "sliding" (incremental, O(new samples))
 CHANNELS_TO_COMBINE = [0, 1, 2, 3]
+ARTIFACT_REJECTION = True  # windows with blinks/jaw clenches leave the CC (and its scaling) untouched
+ARTIFACT_MAX_PTP = 500.0   # peak-to-peak limit (uV) of the combined signal
 MIDI_CHANNEL = 0
-MIDI_CC = 113
+MIDI_CC = 113            # with several streams, stream i drives CC MIDI_CC + i
 MIN_CC = 0
 MAX_CC = 127
-SEND_INTERVAL = 0.02
+MIDI_MAX_RATE = 500      # messages/s per port; pending CC values are coalesced to the latest
+MIDI_LATENCY_SEC = 0.15  # each CC goes out this long after its (dejittered) EEG sample; None = right away
 ALPHA_SMOOTH = 0.3       # smoothing for alpha power
 ROLLING_NORM_SEC = 5.0   # running min/max for adaptive scaling
+ROLLING_NORM_BY_TIME = False  # True -> window is ROLLING_NORM_SEC of wall time, not a count of updates
+NORM_MODE = "minmax"     # "minmax" (rolling window) or "quantile" (streaming 5th-95th percentile)
+SHOW_PLOT = False        # live plot in a separate viewer process (headless by default)
 PLOT_LENGTH = 200
+PLOT_FPS = 20            # viewer frame-rate cap; it drops frames rather than slowing MIDI
+LATENCY_REPORT_SEC = 5.0 # seconds between latency reports (None = off)
+LATENCY_LOG = None       # e.g. "latency.jsonl" -> append each report as JSON
+TRACE_FILE = None        # e.g. "session.trace" -> per-window trace (python -m eeg_to_midi.trace session.trace)
+PROFILE_FILE = None      # e.g. "profile.folded" -> sampling profiler; `kill -USR1 <pid>` pauses/resumes it
 # ----------------
 
-# ---- FIND EEG STREAM ----
-streams = resolve_streams()
-eeg_streams = [s for s in streams if s.type() == "EEG"]
+# ---- FIND EEG STREAMS (one inlet per headset, all read from this loop) ----
+eeg_streams = resolve_streams_of_type("EEG", LSL_STREAM_NAMES)
 if not eeg_streams:
     raise RuntimeError("No EEG streams found.")
-eeg_info = eeg_streams[0]
-print(f"Using EEG stream: {eeg_info.name()} with {eeg_info.channel_count()} channels.")
-
-# ---- OPEN MIDI ----
-midi_out = mido.open_output(LOOPMIDI_PORT_NAME)
-print(f"Opened MIDI output: {LOOPMIDI_PORT_NAME}")
-
-# ---- SETUP EEG INLET ----
-inlet = StreamInlet(eeg_info, max_chunklen=1024)
-sfreq = eeg_info.nominal_srate()
-window_samples = int(SAMPLE_WINDOW_SEC * sfreq)
-buffer = deque(maxlen=window_samples)
-
-# Running history for adaptive min/max normalization
-norm_window_samples = int(ROLLING_NORM_SEC * sfreq)
-bp_history = deque(maxlen=norm_window_samples)
-
-last_send_time = 0
-smoothed_alpha = None
-
-# ---- BANDPOWER FUNCTION ----
-def bandpower(signal_window, sfreq, band):
-    fmin, fmax = band
-    if len(signal_window) < 4:
-        return 0.0
-    signal_window = signal_window - np.mean(signal_window)
-    freqs, psd = welch(signal_window, fs=sfreq, nperseg=min(256, len(signal_window)))
-    mask = (freqs >= fmin) & (freqs <= fmax)
-    return np.trapz(psd[mask], freqs[mask]) if np.any(mask) else 0.0
+if MIDI_CC + len(eeg_streams) - 1 > 119:  # CC 120-127 are channel mode messages
+    raise RuntimeError(f"{len(eeg_streams)} streams need CC{MIDI_CC}-CC{MIDI_CC + len(eeg_streams) - 1} "
+                       "but controllers stop at CC119; lower MIDI_CC or set LSL_STREAM_NAMES.")
+# each stream buffers only its combined channel
+streams = MultiInlet(eeg_streams, SAMPLE_WINDOW_SEC, buffer_chan=1)
+for s in streams:
+    s.cc = MIDI_CC + s.index
+    print(f"Using EEG stream: {s.name} with {s.n_chan} channels -> CC{s.cc}.")
+
+# ---- OPEN MIDI (sent from a background thread per port; send() only queues) ----
+ports = []
+for name in [LOOPMIDI_PORT_NAME] + MIDI_FANOUT_PORTS:
+    ports.append(mido.open_output(name))
+    print(f"Opened MIDI output: {name}")
+midi_out = AsyncMidiOut(ports, max_rate=MIDI_MAX_RATE)
+# Fixed-latency timing on the LSL clock: each CC is due MIDI_LATENCY_SEC after
+# its stream's dejittered sample time, so the delay does not follow LSL chunking
+scheduler = EventScheduler(midi_out, clock=local_clock).start() if MIDI_LATENCY_SEC else None
+
+# ---- PER-STREAM STATE ----
+for s in streams:
+    # Running history for adaptive min/max normalization (O(1) per update)
+    if NORM_MODE == "quantile":
+        s.normalizer = QuantileScaler(0.05, 0.95)
+    elif ROLLING_NORM_BY_TIME:
+        s.normalizer = RollingMinMax(ROLLING_NORM_SEC, by_time=True)
+    else:
+        s.normalizer = RollingMinMax(int(ROLLING_NORM_SEC * s.fs))
+    s.last_sent_value = None
+    s.smoothed_alpha = None
+    s.cc_value = 0
+    # amplitude / kurtosis / robust z checks on the combined window
+    s.artifacts = default_detector(ARTIFACT_MAX_PTP) if ARTIFACT_REJECTION else None
+    # Incremental alternative: sliding DFT over the alpha bins, one Welch segment per window
+    s.sliding = None
+    if BANDPOWER_BACKEND == "sliding":
+        s.sliding = SlidingBandPower(s.fs, s.window_samples, ALPHA_BAND, reduce="trapz")
+
+# ---- BANDPOWER ENGINE ----
+# welch() removes the per-segment mean itself, so no explicit detrend is needed.
+# One engine per sample rate; streams at the same rate share one PSD call.
+_engines = {}
+
+def alpha_engine(sfreq, n):
+    if (sfreq, n) not in _engines:
+        _engines[sfreq, n] = BandPowerEngine(sfreq, min(256, n), ALPHA_BAND, reduce="trapz")
+    return _engines[sfreq, n]
+
+def bandpower(windows, sfreq):
+    """Alpha power of each column of a (n_samples, n_streams) block."""
+    return alpha_engine(sfreq, len(windows)).compute(windows)[0]
+
+if BANDPOWER_BACKEND != "sliding":
+    for s in streams:
+        alpha_engine(s.fs, s.window_samples)  # build now, not on the first window
 
 # ---- LIVE PLOT SETUP ----
-plt.ion()
-fig, ax = plt.subplots()
-line_power, = ax.plot([], [], label="Smoothed Alpha Power")
-line_cc, = ax.plot([], [], label="MIDI CC1")
-ax.set_ylim(0, 130)
-ax.set_xlim(0, PLOT_LENGTH)
-ax.set_xlabel("Samples")
-ax.set_ylabel("Value")
-ax.legend()
-power_data = []
-cc_data = []
-
-print("Starting EEG -> MIDI CC1 in parallel with smoothed alpha power... (Ctrl-C to exit)")
+plot_feed = None
+if SHOW_PLOT:
+    labels = []
+    for s in streams:
+        prefix = f"{s.name}: " if len(streams) > 1 else ""
+        labels += [f"{prefix}Smoothed Alpha Power", f"{prefix}MIDI CC{s.cc}"]
+    plot_feed = PlotFeed(labels, length=PLOT_LENGTH, ylim=(0, 130), fps=PLOT_FPS).start()
+
+# ---- LATENCY INSTRUMENTATION (against the LSL clock) ----
+monitor = LatencyMonitor(local_clock, LATENCY_REPORT_SEC, LATENCY_LOG, late_after=MIDI_LATENCY_SEC or 0.1)
+streams.update_time_corrections()
+
+# ---- TRACE (per-window record, written out in the background) AND PROFILER ----
+tracer = Tracer(TRACE_FILE, max_chan=1, streams=[s.name for s in streams])
+profiler = None
+if PROFILE_FILE:
+    profiler = SamplingProfiler(PROFILE_FILE).start()
+    profiler.install_toggle()
+
+print(f"Starting EEG -> MIDI CC{MIDI_CC}{f'-CC{MIDI_CC + len(streams) - 1}' if len(streams) > 1 else ''} with smoothed alpha power... (Ctrl-C to exit)")
 
 try:
     while True:
-        samples, ts = inlet.pull_chunk(timeout=1.0, max_samples=window_samples)
-        if not samples:
-            continue
-        arr = np.array(samples)
-
-        # Combine channels 0-3
-        combined = np.mean(arr[:, CHANNELS_TO_COMBINE], axis=1)
-        buffer.extend(combined.tolist())
-        if len(buffer) < window_samples:
+        t = t_loop = monitor.now()
+        ready = streams.poll()  # non-blocking pull on every inlet
+        if not ready:
+            time.sleep(0.005)
             continue
-
-        # Compute alpha bandpower
-        window = np.array(buffer)
-        bp = bandpower(window, sfreq, ALPHA_BAND)
-
-        # Smooth alpha power to reduce spikes
-        if smoothed_alpha is None:
-            smoothed_alpha = bp
-        else:
-            smoothed_alpha = ALPHA_SMOOTH * bp + (1 - ALPHA_SMOOTH) * smoothed_alpha
-
-        # Update running history for adaptive scaling
-        bp_history.append(smoothed_alpha)
-        min_bp = min(bp_history)
-        max_bp = max(bp_history)
-        # Map smoothed alpha to 0-1
-        norm = (smoothed_alpha - min_bp) / max(1e-12, max_bp - min_bp)
-        norm = np.clip(norm, 0, 1)
-
-        # Map normalized alpha directly to CC1 (parallel change)
-        cc_value = int(MIN_CC + (MAX_CC - MIN_CC) * norm)
-
-        # Send MIDI CC at controlled rate
-        now = time.time()
-        if now - last_send_time >= SEND_INTERVAL:
-            midi_out.send(mido.Message('control_change', control=MIDI_CC, value=cc_value, channel=MIDI_CHANNEL))
-            last_send_time = now
-
-        # ---- UPDATE LIVE PLOT ----
-        power_data.append(smoothed_alpha)
-        cc_data.append(cc_value)
-        if len(power_data) > PLOT_LENGTH:
-            power_data = power_data[-PLOT_LENGTH:]
-            cc_data = cc_data[-PLOT_LENGTH:]
-        line_power.set_ydata(power_data)
-        line_power.set_xdata(range(len(power_data)))
-        line_cc.set_ydata(cc_data)
-        line_cc.set_xdata(range(len(cc_data)))
-        ax.set_xlim(0, max(PLOT_LENGTH, len(power_data)))
-        ax.figure.canvas.draw()
-        ax.figure.canvas.flush_events()
+        t = monitor.stage("pull", t)
+
+        alpha = {}
+        for s in ready:
+            monitor.samples(s.timestamps, s.fs, stream=s.index)
+            # Combine channels 0-3
+            combined = np.mean(s.samples[:, CHANNELS_TO_COMBINE], axis=1)
+            s.buffer.extend(combined)
+            if s.sliding is not None:
+                bp = s.sliding.update(combined)[0, 0]
+                if s.buffer.is_full:
+                    alpha[s.index] = bp
+        t = monitor.stage("buffer", t)
+
+        # Streams whose current window is an artifact skip the spectral stage this round
+        if ARTIFACT_REJECTION:
+            clean = [s for s in ready
+                     if not (s.buffer.is_full and s.artifacts.check(s.buffer.latest(), len(s.samples))[0])]
+            for s in ready:
+                if s not in clean:
+                    alpha.pop(s.index, None)
+                    tracer.window(t, s.index, len(s.samples), monitor.now() - t_loop, artifact=True)
+            ready = clean
+        t = monitor.stage("artifacts", t)
+
+        # Compute alpha bandpower, one call per sample rate across all streams
+        if BANDPOWER_BACKEND != "sliding":
+            for fs, _, members, windows, _ in stacked_windows(ready):
+                for s, bp in zip(members, bandpower(windows, fs)):
+                    alpha[s.index] = bp
+        if alpha:
+            t = monitor.stage("spectral", t)
+
+        for s in ready:
+            if s.index not in alpha:
+                continue
+            bp = alpha[s.index]
+            # Smooth alpha power to reduce spikes
+            if s.smoothed_alpha is None:
+                s.smoothed_alpha = bp
+            else:
+                s.smoothed_alpha = ALPHA_SMOOTH * bp + (1 - ALPHA_SMOOTH) * s.smoothed_alpha
+
+            # Update running history for adaptive scaling and map smoothed alpha to 0-1
+            norm = s.normalizer.update(s.smoothed_alpha, local_clock())
+
+            # Map normalized alpha directly to the stream's CC (parallel change)
+            s.cc_value = int(MIN_CC + (MAX_CC - MIN_CC) * norm)
+            t = monitor.stage("mapping", t)
+
+            # Queue MIDI CC when it changes; the output stage coalesces and rate-limits
+            if s.cc_value != s.last_sent_value:
+                msg = mido.Message('control_change', control=s.cc, value=s.cc_value, channel=MIDI_CHANNEL)
+                if scheduler is None:
+                    midi_out.send(msg)
+                else:
+                    scheduler.schedule(s.sample_time + MIDI_LATENCY_SEC, msg)
+                monitor.sent(s.timestamps[-1], s.time_correction)
+                t = monitor.stage("send", t)
+                tracer.midi_message(t, s.index, msg)
+                s.last_sent_value = s.cc_value
+                events = 1
+            else:
+                monitor.drop_event()
+                events = 0
+            tracer.window(t, s.index, len(s.samples), t - t_loop, events, power=(bp,))
+
+        # ---- UPDATE LIVE PLOT (viewer process draws at its own pace) ----
+        if plot_feed is not None:
+            values = []
+            for s in streams:
+                values += [s.smoothed_alpha or 0.0, s.cc_value]
+            plot_feed.push(*values)
+
+        tracer.maybe_flush()
+        if monitor.maybe_report():
+            streams.update_time_corrections(timeout=0.0)
+            if scheduler is not None:
+                scheduler.report()
+                scheduler.reset_stats()
 
         time.sleep(0.005)
 
 except KeyboardInterrupt:
+    monitor.report()
+    if profiler is not None:
+        profiler.stop()
+    for s in streams:
+        if s.artifacts is not None:
+            print(f"{s.name}: {s.artifacts.summary()}")
     print("Interrupted, closing MIDI output...")
+    if scheduler is not None:
+        scheduler.wait_until_idle(timeout=MIDI_LATENCY_SEC + 0.5)
+        scheduler.stop(release_notes=False)
+        scheduler.report()
     midi_out.close()
+    midi_out.report()
+    if plot_feed is not None:
+        plot_feed.close()
+    tracer.close()
+    if TRACE_FILE:
+        print(f"Trace: {tracer.written} rows -> {TRACE_FILE} (dropped {tracer.dropped})")
     print("Exit cleanly.")
@@ -1,51 +1,43 @@
 # eeg_to_midi.py
 """
 EEG -> MIDI bridge (LSL -> loopMIDI)
-Dependencies: pylsl, mido, python-rtmidi, numpy, scipy (optional but recommended)
-pip install pylsl mido python-rtmidi numpy scipy
+Dependencies: pylsl, mido, python-rtmidi, numpy
+pip install pylsl mido python-rtmidi numpy
 """
 
 import time
+import sys
+from pathlib import Path
 import numpy as np
-from pylsl import StreamInlet, resolve_byprop
+from pylsl import resolve_byprop, local_clock
 import mido
-from collections import deque
-
-# Optional: from scipy.signal import welch, butter, filtfilt
-from scipy.signal import welch
-
-# ---- CHECKING AVAILABLE PORTS ----
-
-import mido
-
-print("MIDI Input Ports:")
-for name in mido.get_input_names():
-    print("  ", name)
-
-print("\nMIDI Output Ports:")
-for name in mido.get_output_names():
-    print("  ", name)
-
-# ---- LSL streams ----
-from pylsl import resolve_streams
-
-print("Scanning for all LSL streams...")
-streams = resolve_streams()
-for s in streams:
-    print(f"Name: {s.name()}  |  Type: {s.type()}  |  Channels: {s.channel_count()}")
-
-
-
-
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root
+from eeg_to_midi.spectral import BandPowerEngine, SlidingBandPower
+from eeg_to_midi.mapping import HysteresisGate
+from eeg_to_midi.lsl import MultiInlet, resolve_streams_of_type, stacked_windows
+from eeg_to_midi.latency import LatencyMonitor
+from eeg_to_midi.midi import AsyncMidiOut
+from eeg_to_midi.scheduler import EventScheduler
+from eeg_to_midi.artifacts import default_detector
+from eeg_to_midi.recording import match_channels
+from eeg_to_midi.trace import Tracer, SamplingProfiler
 
 # ---- USER CONFIG ----
 LSL_STREAM_TYPE = "EEG"          # change if your stream has a different type/name
+LSL_STREAM_NAMES = None          # None -> every stream of LSL_STREAM_TYPE (one per headset); or e.g. ["Muse-A", "Muse-B"]
 LOOPMIDI_PORT_NAME = "EEG_MIDI 1"   # name of the loopMIDI output port you created
+MIDI_FANOUT_PORTS = []           # extra output ports that get a copy of every message
+MIDI_MAX_RATE = 1000             # messages/s per port (sent from a background thread)
+MIDI_LATENCY_SEC = 0.15          # each event goes out this long after its (dejittered) EEG sample; None = right away
 SAMPLE_WINDOW_SEC = 1.0          # time window for feature computation (seconds)
 BAND = (8.0, 12.0)               # frequency band to use (alpha = 8-12 Hz)
+BANDPOWER_BACKEND = "welch"      # "welch" (full PSD per chunk) or "sliding" (incremental, O(new samples))
+ARTIFACT_REJECTION = True        # channels with a blink/jaw clench in their window play nothing (notes keep their state)
+ARTIFACT_MAX_PTP = 500.0         # peak-to-peak limit per channel (uV); relative checks adapt on their own
+ARTIFACT_CHANNELS = ["TP9", "AF7", "AF8", "TP10"]  # EEG channels to check (Muse); others (AUX) are never masked; None = all
 MIDI_BASE_NOTE = 60              # MIDI note for channel 0, channel i -> note = base + i
-MIDI_CHANNEL = 0                 # 0-15
+MIDI_CHANNEL = 0                 # 0-15; with several streams, stream i plays on MIDI_CHANNEL + i
 POWER_TO_VEL_EXP = 1.0           # exponent to shape mapping curve (1 = linear)
 ON_THRESHOLD = 0.4               # normalized threshold to send Note On
 OFF_THRESHOLD = 0.30             # hysteresis lower threshold for Note Off
@@ -53,29 +45,42 @@ MIN_VEL = 10
 MAX_VEL = 127
 MAX_NOTES_PER_CHANNEL = 1        # how many simultaneous notes per EEG channel
 SILENCE_AFTER = 1.0              # seconds of inactivity to auto-send NoteOff (safety)
+LATENCY_REPORT_SEC = 5.0         # seconds between latency reports (None = off)
+LATENCY_LOG = None               # e.g. "latency.jsonl" -> append each report as JSON
+TRACE_FILE = None                # e.g. "session.trace" -> per-window trace (python -m eeg_to_midi.trace session.trace)
+PROFILE_FILE = None              # e.g. "profile.folded" -> sampling profiler; `kill -USR1 <pid>` pauses/resumes it
 # ----------------------
 
-def find_lsl_stream():
+def find_lsl_streams():
     print("Resolving LSL streams...")
-    streams = resolve_byprop('type', LSL_STREAM_TYPE, timeout=5)
-    if not streams:
+    streams = resolve_streams_of_type(LSL_STREAM_TYPE, LSL_STREAM_NAMES)
+    if not streams and not LSL_STREAM_NAMES:
         print(f"No LSL stream with type '{LSL_STREAM_TYPE}' found. Trying any EEG stream name...")
         streams = resolve_byprop('name', 'EEG', timeout=5)
     if not streams:
         raise RuntimeError("No suitable LSL EEG stream found. Make sure LabRecorder / your device is streaming.")
-    print(f"Found stream: {streams[0].name()} ({streams[0].type()})")
-    return streams[0]
+    if len(streams) > 16:
+        raise RuntimeError(f"{len(streams)} streams found but MIDI only has 16 channels; set LSL_STREAM_NAMES.")
+    for s in streams:
+        print(f"Found stream: {s.name()} ({s.type()})")
+    return streams
+
+_engines = {}
+
+def bandpower_engine(sfreq, n_samples, band):
+    # the engine for each (sfreq, nperseg, band) is built once and reused across windows
+    nperseg = min(256, n_samples)
+    key = (sfreq, nperseg, band)
+    if key not in _engines:
+        _engines[key] = BandPowerEngine(sfreq, nperseg, band, reduce="trapz")
+    return _engines[key]
 
 def bandpower_from_window(signal_window, sfreq, band):
-    # Use Welch's method for band power estimation
-    fmin, fmax = band
+    # Use Welch's method for band power estimation (PSD integrated over band).
+    # Accepts (n_samples,) or (n_samples, n_chan).
     if len(signal_window) < 4:
         return 0.0
-    freqs, psd = welch(signal_window, fs=sfreq, nperseg=min(256, len(signal_window)))
-    # integrate PSD over band
-    band_mask = (freqs >= fmin) & (freqs <= fmax)
-    bp = np.trapz(psd[band_mask], freqs[band_mask]) if np.any(band_mask) else 0.0
-    return bp
+    return bandpower_engine(sfreq, len(signal_window), band).compute(signal_window)[0]
 
 def normalize_array(arr):
     arr = np.array(arr, dtype=float)
@@ -88,97 +93,176 @@ def normalize_array(arr):
         return np.zeros_like(arr)
     return arr / mx
 
+def artifact_channels(s):
+    # Columns of ARTIFACT_CHANNELS in the stream; all of them if it has none of those labels
+    if ARTIFACT_CHANNELS is None:
+        return np.arange(s.n_chan)
+    checked = match_channels(ARTIFACT_CHANNELS, s.labels, required=False)
+    if not checked:
+        print(f"⚠️ {s.name}: no channel labelled {ARTIFACT_CHANNELS} (has {s.labels}); checking all channels")
+        return np.arange(s.n_chan)
+    return np.array(checked)
+
 def open_midi_out(port_name):
-    out_ports = mido.get_output_names()
-    print("Available MIDI outputs:", out_ports)
-    if port_name not in out_ports:
-        raise RuntimeError(f"MIDI output '{port_name}' not visible. Make sure loopMIDI is running and port exists.")
-    out = mido.open_output(port_name)
+    # ports are only listed if the open fails (`python -m eeg_to_midi list` shows them up front)
+    try:
+        out = mido.open_output(port_name)
+    except IOError:
+        raise RuntimeError(f"MIDI output '{port_name}' not visible (available: {mido.get_output_names()}). "
+                           "Make sure loopMIDI is running and port exists.") from None
     print(f"Opened MIDI output: {port_name}")
     return out
 
 def main():
-    stream_info = find_lsl_stream()
-    inlet = StreamInlet(stream_info, max_chunklen=1024)
-    sfreq = float(stream_info.nominal_srate())
-    n_chan = int(stream_info.channel_count())
-    print(f"Sampling rate: {sfreq} Hz, channels: {n_chan}")
+    # one inlet per headset, all read from this loop
+    streams = MultiInlet(find_lsl_streams(), SAMPLE_WINDOW_SEC)
+    for s in streams:
+        s.midi_channel = (MIDI_CHANNEL + s.index) % 16
+        print(f"{s.name}: {s.fs} Hz, {s.n_chan} channels -> MIDI channel {s.midi_channel}")
+        # optional incremental estimator (single Welch segment over the whole window)
+        s.sliding = None
+        if BANDPOWER_BACKEND == "sliding":
+            s.sliding = SlidingBandPower(s.fs, s.window_samples, BAND, s.n_chan, reduce="trapz")
+        else:
+            bandpower_engine(s.fs, s.window_samples, BAND)  # build now, not on the first window
+        # state per channel for Note On/Off (hysteresis evaluated over all channels at once)
+        s.gate = HysteresisGate(s.n_chan, ON_THRESHOLD, OFF_THRESHOLD, SILENCE_AFTER)
+        s.notes = MIDI_BASE_NOTE + np.arange(s.n_chan)  # one note per channel
+        # amplitude / kurtosis / robust z checks over the stream's EEG channels at once
+        s.artifacts = default_detector(ARTIFACT_MAX_PTP, channels=ARTIFACT_CHANNELS) if ARTIFACT_REJECTION else None
+        s.checked = artifact_channels(s)
+        s.bad = np.zeros(s.n_chan, dtype=bool)  # channels masked as artifacts in the current window
+
+    # sends happen on a background thread per port; send() below only queues
+    midi_out = AsyncMidiOut([open_midi_out(name) for name in [LOOPMIDI_PORT_NAME] + MIDI_FANOUT_PORTS],
+                            max_rate=MIDI_MAX_RATE)
 
-    midi_out = open_midi_out(LOOPMIDI_PORT_NAME)
+    # Events are timed on the LSL clock (monotonic): each one is due a fixed
+    # latency after its stream's dejittered sample time, so the delay stays
+    # constant however bursty the chunks are
+    scheduler = EventScheduler(midi_out, clock=local_clock).start() if MIDI_LATENCY_SEC else None
 
-    # buffers for each channel
-    window_samples = int(max(1, SAMPLE_WINDOW_SEC * sfreq))
-    buffers = [deque(maxlen=window_samples) for _ in range(n_chan)]
+    def send(msg, s):
+        if scheduler is None:
+            midi_out.send(msg)
+        else:
+            scheduler.schedule(s.sample_time + MIDI_LATENCY_SEC, msg)
+        monitor.sent(s.timestamps[-1], s.time_correction)
+        tracer.midi_message(monitor.now(), s.index, msg)
 
-    # state per channel for Note On/Off
-    is_on = [False] * n_chan
-    last_on_time = [0.0] * n_chan
+    # per-stage and sample -> MIDI latency against the LSL clock; with a fixed
+    # latency, an event computed after its deadline counts as late
+    monitor = LatencyMonitor(local_clock, LATENCY_REPORT_SEC, LATENCY_LOG, late_after=MIDI_LATENCY_SEC or 0.1)
+    streams.update_time_corrections()
+
+    # Per-window record of what happened (kept in memory, written out in the background)
+    tracer = Tracer(TRACE_FILE, max_chan=max(s.n_chan for s in streams), streams=[s.name for s in streams])
+    profiler = None
+    if PROFILE_FILE:
+        profiler = SamplingProfiler(PROFILE_FILE).start()
+        profiler.install_toggle()
 
     print("Starting main loop (press Ctrl-C to exit)...")
     try:
         while True:
-            samples, timestamps = inlet.pull_chunk(timeout=1.0, max_samples=window_samples)
-            if not samples:
+            t = t_loop = monitor.now()
+            ready = streams.poll()  # non-blocking pull on every inlet
+            if not ready:
                 # no new data, small sleep and continue
-                time.sleep(0.01)
+                time.sleep(0.001)
                 continue
-            # samples is list of sample arrays (n_samples x n_chan)
-            arr = np.array(samples)
-            # append to per-channel buffers
-            for ch in range(n_chan):
-                col = arr[:, ch]
-                buffers[ch].extend(col.tolist())
-
-            # If we have enough samples, compute bandpower for each channel
-            if any(len(buff) >= window_samples for buff in buffers):
-                powers = []
-                for ch in range(n_chan):
-                    buff = np.array(buffers[ch])
-                    bp = bandpower_from_window(buff, sfreq, BAND)
-                    powers.append(bp)
-                # normalize powers across channels (so mapping doesn't saturate)
-                norm = normalize_array(powers)  # 0..1
+            t = monitor.stage("pull", t)
+            for s in ready:
+                monitor.samples(s.timestamps, s.fs, stream=s.index)
+                # s.samples is a (n_samples x n_chan) view of the stream's pull buffer
+                s.buffer.extend(s.samples)
+            t = monitor.stage("buffer", t)
+
+            # Channels whose current window is an artifact are masked this round;
+            # a stream with every channel masked skips the spectral stage
+            if ARTIFACT_REJECTION:
+                for s in ready:
+                    if s.buffer.is_full:
+                        window = s.buffer.latest()[:, s.checked]
+                        s.bad[s.checked] = s.artifacts.check_channels(window, len(s.samples))[0]
+            clean = [s for s in ready if not s.bad.all()]
+            t = monitor.stage("artifacts", t)
+            for s in ready:
+                if s.buffer.is_full and s not in clean:
+                    tracer.window(t, s.index, len(s.samples), t - t_loop, artifact=True)
+
+            # If we have enough samples, compute bandpower for every channel of every clean stream
+            powers = {}
+            if BANDPOWER_BACKEND == "sliding":
+                for s in ready:
+                    p = s.sliding.update(s.samples)[0]  # keeps its running sums current either way
+                    if s.buffer.is_full and s in clean:
+                        powers[s.index] = p
+            else:
+                # one PSD call per (rate, window) group, across all headsets
+                for fs, _, members, windows, splits in stacked_windows(clean):
+                    for s, p in zip(members, np.split(bandpower_from_window(windows, fs, BAND), splits)):
+                        powers[s.index] = p
+            if powers:
+                t = monitor.stage("spectral", t)
+
+            now = local_clock()  # monotonic, unlike time.time()
+            for s in ready:
+                if s.index not in powers:
+                    continue
+                # normalize powers across the stream's unmasked channels (so mapping doesn't saturate)
+                norm = np.zeros(s.n_chan)
+                norm[~s.bad] = normalize_array(powers[s.index][~s.bad])  # 0..1
                 # map to MIDI velocities
-                velocities = [int(MIN_VEL + (MAX_VEL - MIN_VEL) * (v ** POWER_TO_VEL_EXP)) for v in norm]
-
-                now = time.time()
-                for ch in range(n_chan):
-                    vel = velocities[ch]
-                    note = MIDI_BASE_NOTE + ch  # one note per channel
-                    p = norm[ch]
-                    # Hysteresis thresholding
-                    if not is_on[ch] and p >= ON_THRESHOLD:
-                        # send note on
-                        msg = mido.Message('note_on', note=note, velocity=vel, channel=MIDI_CHANNEL)
-                        midi_out.send(msg)
-                        is_on[ch] = True
-                        last_on_time[ch] = now
-                        # debug
-                        print(f"[{now:.3f}] CH{ch}: NOTE ON {note} vel={vel} p={p:.3f}")
-                    elif is_on[ch]:
-                        # if falls below off threshold or hasn't been active for a while, send note_off
-                        if p <= OFF_THRESHOLD or (now - last_on_time[ch] > SILENCE_AFTER and p < OFF_THRESHOLD + 0.05):
-                            msg = mido.Message('note_off', note=note, velocity=0, channel=MIDI_CHANNEL)
-                            midi_out.send(msg)
-                            is_on[ch] = False
-                            print(f"[{now:.3f}] CH{ch}: NOTE OFF {note} p={p:.3f}")
-                        else:
-                            # you might want to send velocity/aftertouch/CC updates while note is on
-                            # as an example, update velocity via MIDI CC (or send note_on with velocity to retrigger)
-                            # Example: send Channel Pressure (not all synths support)
-                            # midi_out.send(mido.Message('polytouch', note=note, value=vel, channel=MIDI_CHANNEL))
-                            pass
-
-            # Very small sleep to avoid busy-looping
-            time.sleep(0.001)
+                velocities = (MIN_VEL + (MAX_VEL - MIN_VEL) * norm ** POWER_TO_VEL_EXP).astype(int)
+
+                # Hysteresis thresholding; masked channels keep their note state
+                turn_on, turn_off = s.gate.update(norm, now, hold=s.bad)
+                t = monitor.stage("mapping", t)
+                # notes go to the trace (python -m eeg_to_midi.trace), not the console
+                for ch in np.flatnonzero(turn_on):
+                    send(mido.Message('note_on', note=int(s.notes[ch]), velocity=int(velocities[ch]),
+                                      channel=s.midi_channel), s)
+                for ch in np.flatnonzero(turn_off):
+                    # fell below off threshold or hasn't been active for a while
+                    send(mido.Message('note_off', note=int(s.notes[ch]), velocity=0, channel=s.midi_channel), s)
+                t = monitor.stage("send", t)
+                tracer.window(t, s.index, len(s.samples), t - t_loop,
+                              events=int(np.count_nonzero(turn_on) + np.count_nonzero(turn_off)),
+                              artifact=bool(s.bad.any()), power=np.where(s.bad, np.nan, powers[s.index]))
+                # you might want to send velocity/aftertouch/CC updates for channels still on
+                # Example: send Channel Pressure (not all synths support)
+                # midi_out.send(mido.Message('polytouch', note=note, value=vel, channel=s.midi_channel))
+
+            tracer.maybe_flush()
+            if monitor.maybe_report():
+                # refresh the clock offsets between reports; cheap once established
+                streams.update_time_corrections(timeout=0.0)
+                if scheduler is not None:
+                    scheduler.report()
+                    scheduler.reset_stats()
 
     except KeyboardInterrupt:
+        monitor.report()
+        if profiler is not None:
+            profiler.stop()
+        for s in streams:
+            if s.artifacts is not None:
+                print(f"{s.name}: {s.artifacts.summary()}")
+        if scheduler is not None:
+            # let queued events (at most MIDI_LATENCY_SEC ahead) go out, so no note-off is lost
+            scheduler.wait_until_idle(timeout=MIDI_LATENCY_SEC + 0.5)
+            scheduler.stop(release_notes=False)
+            scheduler.report()
         print("Interrupted, sending pending Note Offs...")
-        for ch in range(n_chan):
-            if is_on[ch]:
-                note = MIDI_BASE_NOTE + ch
-                midi_out.send(mido.Message('note_off', note=note, velocity=0, channel=MIDI_CHANNEL))
-        midi_out.close()
+        for s in streams:
+            for ch in np.flatnonzero(s.gate.is_on):
+                midi_out.send(mido.Message('note_off', note=int(s.notes[ch]), velocity=0, channel=s.midi_channel))
+        midi_out.close()  # flushes the queued Note Offs first
+        midi_out.report()
+        tracer.close()
+        if TRACE_FILE:
+            print(f"Trace: {tracer.written} rows -> {TRACE_FILE} (dropped {tracer.dropped})")
         print("Exit cleanly.")
 
 if __name__ == "__main__":
@@ -1,75 +1,71 @@
-# --- CHECKING PORTS ---
-import mido
-print("Available MIDI output ports:")
-print(mido.get_output_names())
-
 # --- DEPENDENCIES ---
-import pandas as pd
-import numpy as np
-import time
-import mido
-from scipy.signal import welch
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root
+from eeg_to_midi.mapping import map_power_to_notes
+from eeg_to_midi.recording import open_recording
+from eeg_to_midi.features import iter_features
+from eeg_to_midi.render import note_events, MidiFileSink
+from eeg_to_midi.scheduler import PlaybackSink
+from eeg_to_midi.midi import open_output
 
 # --- SETTINGS ---
-CSV_FILE = "cleaned_eeg.csv"
+EEG_FILE = "cleaned_eeg.csv"      # .csv or .xdf (e.g. "../30s_eeg.xdf")
 CHANNEL = "AF8"           # EEG electrode channel
-FS = 256                  # Muse sample rate (Hz)
-WINDOW_SEC = 1          # sliding window in seconds (smaller = more notes)
+FS = 256                  # sample rate of .csv files (.xdf files carry their own)
+WINDOW_SEC = 1          # analysis window in seconds (longer = finer frequency resolution)
+HOP_SEC = None          # seconds between notes (None = WINDOW_SEC); smaller = more notes, windows overlap
 MIDI_PORT = "EEG_MIDI 2"    # virtual port name (through loopMIDI)
+RENDER_MIDI = None        # e.g. "session.mid" -> render to a file instead of playing live
+BLOCK_SAMPLES = 256 * 60  # samples read from the file at a time
+FEATURE_INDEX = True      # keep per-window band powers in <file>.features/ so mapping changes skip the spectral pass
 
 NOTE_RANGE_LOW = 48       # C3
 NOTE_RANGE_HIGH = 72      # C5
 VELOCITY_MIN = 40
 VELOCITY_MAX = 80
 
-# --- FUNCTION: compute EEG bandpower ---
-def bandpower(data, fs, band=(8, 12)):
-    freqs, psd = welch(data, fs=fs, nperseg=len(data))
-    idx = np.logical_and(freqs >= band[0], freqs <= band[1])
-    return np.mean(psd[idx])
+# --- OPEN RECORDING (.csv/.xdf; memory-mapped binary cache after the first run) ---
+recording = open_recording(EEG_FILE, fs=FS)
+fs = recording.fs
+print(f"Opened {EEG_FILE}: {fs:g} Hz, channels: {', '.join(recording.channels)}")
 
-# --- LOAD EEG .csv ---
-eeg = pd.read_csv(CSV_FILE)
-if "Time" in eeg.columns:
-    eeg = eeg.drop(columns=["Time"])
+# --- OUTPUT: render to .mid or play live ---
+if RENDER_MIDI:
+    sink = MidiFileSink(RENDER_MIDI)
+else:
+    # --- OPEN MIDI PORT (falls back to the first available port) ---
+    outport = open_output(MIDI_PORT)
+    # The scheduler sends every note at its EEG time; nothing here sleeps
+    sink = PlaybackSink(outport)
 
-signal = eeg[CHANNEL].values
-print(f"Loaded {len(signal)} samples from {CHANNEL}")
+# --- STREAM EEG .csv TO MIDI NOTES ---
+window_size = int(fs * WINDOW_SEC)
+hop_sec = HOP_SEC or WINDOW_SEC
+hop = max(1, int(round(fs * HOP_SEC))) if HOP_SEC else window_size
+n_windows = 0
 
-# --- OPEN MIDI PORT ---
-print("Available MIDI outputs:", mido.get_output_names())
 try:
-    outport = mido.open_output(MIDI_PORT)
-    print(f"✅ Connected to MIDI port: {MIDI_PORT}")
-except IOError:
-    ports = mido.get_output_names()
-    if ports:
-        outport = mido.open_output(ports[0])
-        print(f"⚠️ Using fallback MIDI port: {ports[0]}")
-    else:
-        raise RuntimeError("No MIDI output ports available! Create one via loopMIDI or IAC.")
-
-# --- STREAM EEG TO MIDI NOTES ---
-window_size = int(FS * WINDOW_SEC)
-start_time = time.time()
-
-for i in range(0, len(signal) - window_size, window_size):
-    chunk = signal[i:i + window_size]
-    alpha = bandpower(chunk, FS, band=(8,12))
-
-    # Map alpha power to MIDI note
-    midi_value = int(np.clip(np.interp(alpha, [0, 100], [0, 127]), 0, 127))
-    note_val = NOTE_RANGE_LOW + (midi_value * (NOTE_RANGE_HIGH - NOTE_RANGE_LOW) // 127) # dynamic with EEG intensity
-    velocity = int(np.clip(midi_value, VELOCITY_MIN, VELOCITY_MAX)) # dynamic with EEG intensity
+    # Band powers come from the feature index, or are computed one block at a time (one batched PSD per block)
+    for batch in iter_features(recording, window_size, {'alpha': (8, 12)}, BLOCK_SAMPLES, FEATURE_INDEX, hop,
+                               channels=[CHANNEL]):
+        starts = batch.starts
+        alphas = batch.bands(CHANNEL)[:, 0]
 
-    # Send note_on and note_off quickly
-    outport.send(mido.Message('note_on', note=note_val, velocity=velocity))
-    time.sleep(WINDOW_SEC / 2)  # short note duration - allows overlapping notes
-    outport.send(mido.Message('note_off', note=note_val, velocity=velocity))
+        # Map alpha power to MIDI note/velocity (dynamic with EEG intensity)
+        notes, velocities = map_power_to_notes(alphas, NOTE_RANGE_LOW, NOTE_RANGE_HIGH,
+                                               VELOCITY_MIN, VELOCITY_MAX)
 
-    # Keep timing aligned with EEG
-    elapsed = time.time() - start_time
-    target_time = (i + window_size) / FS
-    time.sleep(max(0, target_time - elapsed))
+        # Short note duration - allows overlapping notes
+        sink.add(note_events(starts / fs, hop_sec / 2, notes, velocities))
+        for i, alpha, note_val, velocity in zip(starts, alphas, notes, velocities):
+            sink.log(i / fs, f"t={i/fs:.2f}s | Alpha={alpha:.2f} | Note={note_val} | Vel={velocity}")
+        n_windows += len(starts)
 
-    print(f"t={i/FS:.2f}s | Alpha={alpha:.2f} | Note={note_val} | Vel={velocity}")
+    print(f"Processed {n_windows} windows from {CHANNEL}")
+    sink.finish()
+except KeyboardInterrupt:
+    print("Interrupted, releasing notes...")
+finally:
+    sink.close()
@@ -1,20 +1,26 @@
-# --- CHECKING PORTS ---
-import mido
-print("Available MIDI output ports:")
-print(mido.get_output_names())
-
 # --- DEPENDENCIES ---
-import pandas as pd
 import numpy as np
-import time
-from scipy.signal import welch
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root
+from eeg_to_midi.mapping import map_power_to_notes
+from eeg_to_midi.recording import open_recording
+from eeg_to_midi.features import iter_features
+from eeg_to_midi.render import note_events, MidiFileSink
+from eeg_to_midi.scheduler import PlaybackSink
+from eeg_to_midi.midi import open_output
 
 # --- SETTINGS ---
-CSV_FILE = "cleaned_eeg.csv"
+EEG_FILE = "cleaned_eeg.csv"      # .csv or .xdf (e.g. "../30s_eeg.xdf")
 CHANNEL = "AF7"           # EEG electrode channel
-FS = 256                  # Muse sample rate (Hz)
-WINDOW_SEC = 0.25         # sliding window in seconds
+FS = 256                  # sample rate of .csv files (.xdf files carry their own)
+WINDOW_SEC = 0.25         # analysis window in seconds (longer = finer frequency resolution)
+HOP_SEC = None            # seconds between notes (None = WINDOW_SEC); smaller = more notes, windows overlap
 MIDI_PORT = "EEG_MIDI 2"  # virtual port name (loopMIDI)
+RENDER_MIDI = None        # e.g. "session.mid" -> render to a file instead of playing live
+BLOCK_SAMPLES = 256 * 60  # samples read from the file at a time
+FEATURE_INDEX = True      # keep per-window band powers in <file>.features/ so mapping changes skip the spectral pass
 
 # MIDI settings
 NOTE_RANGE_LOW = 48       # C3
@@ -31,59 +37,49 @@ EEG_BANDS = {
     'gamma': (30, 45)
 }
 
-# --- FUNCTION: compute bandpower ---
-def bandpower(data, fs, band):
-    freqs, psd = welch(data, fs=fs, nperseg=len(data))
-    idx = np.logical_and(freqs >= band[0], freqs <= band[1])
-    return np.mean(psd[idx])
-
-# --- LOAD EEG CSV ---
-eeg = pd.read_csv(CSV_FILE)
-if "Time" in eeg.columns:
-    eeg = eeg.drop(columns=["Time"])
+# --- OPEN RECORDING (.csv/.xdf; memory-mapped binary cache after the first run) ---
+recording = open_recording(EEG_FILE, fs=FS)
+fs = recording.fs
+print(f"Opened {EEG_FILE}: {fs:g} Hz, channels: {', '.join(recording.channels)}")
+
+# --- OUTPUT: render to .mid or play live ---
+if RENDER_MIDI:
+    sink = MidiFileSink(RENDER_MIDI)
+else:
+    # --- OPEN MIDI PORT (falls back to the first available port) ---
+    outport = open_output(MIDI_PORT)
+    # All bands of a window sound together; the scheduler keeps them on EEG time
+    sink = PlaybackSink(outport)
+
+# --- STREAM EEG CSV TO MULTI-BAND MIDI ---
+window_size = int(fs * WINDOW_SEC)
+hop_sec = HOP_SEC or WINDOW_SEC
+hop = max(1, int(round(fs * HOP_SEC))) if HOP_SEC else window_size
+band_offsets = 2 * np.arange(len(EEG_BANDS))  # small offset per band
+n_windows = 0
 
-signal = eeg[CHANNEL].values
-print(f"Loaded {len(signal)} samples from {CHANNEL}")
-
-# --- OPEN MIDI PORT ---
-import mido
 try:
-    outport = mido.open_output(MIDI_PORT)
-    print(f"✅ Connected to MIDI port: {MIDI_PORT}")
-except IOError:
-    ports = mido.get_output_names()
-    if ports:
-        outport = mido.open_output(ports[0])
-        print(f"⚠️ Using fallback MIDI port: {ports[0]}")
-    else:
-        raise RuntimeError("No MIDI output ports available!")
-
-# --- STREAM EEG TO MULTI-BAND MIDI ---
-window_size = int(FS * WINDOW_SEC)
-start_time = time.time()
-
-for i in range(0, len(signal) - window_size, window_size):
-    chunk = signal[i:i + window_size]
-
-    for j, (band_name, band_range) in enumerate(EEG_BANDS.items()):
-        power = bandpower(chunk, FS, band_range)
-
-        # Map power to MIDI note
-        midi_value = int(np.clip(np.interp(power, [0, 100], [0, 127]), 0, 127))
-        note_val = NOTE_RANGE_LOW + (midi_value * (NOTE_RANGE_HIGH - NOTE_RANGE_LOW) // 127)
-        velocity = int(np.clip(midi_value, VELOCITY_MIN, VELOCITY_MAX))
-
-        # Option: offset each band slightly so multiple bands play different notes
-        note_val_band = note_val + j * 2  # small offset per band
-
-        # Send note
-        outport.send(mido.Message('note_on', note=note_val_band, velocity=velocity))
-        time.sleep(WINDOW_SEC / 2)
-        outport.send(mido.Message('note_off', note=note_val_band, velocity=velocity))
-
-        print(f"t={i/FS:.2f}s | {band_name.capitalize()}={power:.2f} | Note={note_val_band} | Vel={velocity}")
-
-    # Keep timing aligned with EEG
-    elapsed = time.time() - start_time
-    target_time = (i + window_size) / FS
-    time.sleep(max(0, target_time - elapsed))
+    # One PSD per window for every band (or straight from the feature index)
+    for batch in iter_features(recording, window_size, EEG_BANDS, BLOCK_SAMPLES, FEATURE_INDEX, hop,
+                               channels=[CHANNEL]):
+        starts = batch.starts
+        band_powers = batch.bands(CHANNEL)  # (n_windows, n_bands)
+
+        # Map power to MIDI note, offsetting each band slightly so multiple bands play different notes
+        notes, velocities = map_power_to_notes(band_powers, NOTE_RANGE_LOW, NOTE_RANGE_HIGH,
+                                               VELOCITY_MIN, VELOCITY_MAX)
+        notes = notes + band_offsets
+
+        sink.add(note_events((starts / fs)[:, None], hop_sec / 2, notes, velocities))
+        for w, i in enumerate(starts):
+            for j, band_name in enumerate(batch.band_names):
+                sink.log(i / fs, f"t={i/fs:.2f}s | {band_name.capitalize()}={band_powers[w, j]:.2f} | "
+                                 f"Note={notes[w, j]} | Vel={velocities[w, j]}")
+        n_windows += len(starts)
+
+    print(f"Processed {n_windows} windows from {CHANNEL}")
+    sink.finish()
+except KeyboardInterrupt:
+    print("Interrupted, releasing notes...")
+finally:
+    sink.close()
@@ -1,14 +1,29 @@
-import mido
-import pandas as pd
 import numpy as np
-import time
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # repo root
+from eeg_to_midi.mapping import map_intensity, dynamic_window
+from eeg_to_midi.normalize import OnlineNormalizer
+from eeg_to_midi.recording import open_recording
+from eeg_to_midi.features import iter_features
+from eeg_to_midi.artifacts import default_detector
+from eeg_to_midi.render import note_events, MidiFileSink
+from eeg_to_midi.scheduler import PlaybackSink
+from eeg_to_midi.midi import open_output
 
 # --- SETTINGS ---
-CSV_FILE = "cleaned_eeg.csv"
+EEG_FILE = "cleaned_eeg.csv"      # .csv or .xdf (e.g. "../30s_eeg.xdf")
 CHANNELS = ["AF7", "AF8", "TP9", "TP10"]
-FS = 256
+FS = 256                   # sample rate of .csv files (.xdf files carry their own)
 WINDOW_SEC_BASE = 1.0      # base window (seconds)
+HOP_SEC = None             # seconds between notes (None = WINDOW_SEC_BASE); smaller = more notes, windows overlap
 MIDI_PORT = "EEG_MIDI 2"
+RENDER_MIDI = None         # e.g. "session.mid" -> render to a file instead of playing live
+BLOCK_SAMPLES = 256 * 60   # samples read from the file at a time
+FEATURE_INDEX = True       # keep per-window powers in <file>.features/ so mapping changes skip recomputing them
+ARTIFACT_REJECTION = True  # skip blink/clench windows: no note, and they stay out of the baseline
+ARTIFACT_MAX_PTP = 500.0   # peak-to-peak limit per channel (uV); relative checks adapt on their own
 
 NOTE_RANGE_LOW = 48        # C3
 NOTE_RANGE_HIGH = 84       # C6 — wider range for intensity
@@ -17,72 +32,89 @@ VELOCITY_MAX = 100
 SENSITIVITY = 5.0          # larger = more reactive to small EEG changes
 TEMPO_SCALE = 0.6          # how strongly brain power affects tempo
 
-# --- LOAD EEG ---
-eeg = pd.read_csv(CSV_FILE)
-if "Time" in eeg.columns:
-    eeg = eeg.drop(columns=["Time"])
+# Baseline for z-scoring power: "online" normalises as it plays (starts immediately),
+# "two-pass" uses mean/std over the whole file first (reproducible)
+BASELINE = "online"
+BASELINE_FORGETTING = None # e.g. 0.02 -> exponential forgetting for drifting sessions
+BASELINE_WARMUP = 10       # windows before the online baseline drives the mapping
 
-missing = [ch for ch in CHANNELS if ch not in eeg.columns]
-if missing:
-    raise ValueError(f"Missing channels in CSV: {missing}")
+# --- OPEN RECORDING (.csv/.xdf; memory-mapped binary cache after the first run) ---
+recording = open_recording(EEG_FILE, fs=FS)
+fs = recording.fs
+print(f"Opened {EEG_FILE}: {fs:g} Hz, channels: {', '.join(recording.channels)}")
 
-print(f"Loaded EEG with {len(eeg)} samples and channels: {', '.join(CHANNELS)}")
+# --- WINDOW POWERS (streamed block by block, or read from the feature index) ---
+window_size = int(fs * WINDOW_SEC_BASE)
+hop_sec = HOP_SEC or WINDOW_SEC_BASE
+hop = max(1, int(round(fs * HOP_SEC))) if HOP_SEC else window_size
 
-# --- OPEN MIDI PORT ---
-print("Available MIDI outputs:", mido.get_output_names())
-try:
-    outport = mido.open_output(MIDI_PORT)
-    print(f"✅ Connected to MIDI port: {MIDI_PORT}")
-except IOError:
-    ports = mido.get_output_names()
-    if ports:
-        outport = mido.open_output(ports[0])
-        print(f"⚠️ Using fallback MIDI port: {ports[0]}")
-    else:
-        raise RuntimeError("No MIDI output ports available! Create one via loopMIDI or IAC.")
+artifacts = default_detector(max_ptp=ARTIFACT_MAX_PTP, channels=CHANNELS) if ARTIFACT_REJECTION else None
+n_rejected = 0
 
-# --- BASELINE STATS ---
-window_size = int(FS * WINDOW_SEC_BASE)
-combined_powers = []
-for i in range(0, len(eeg) - window_size, window_size):
-    segment = eeg.iloc[i:i + window_size][CHANNELS].values
-    combined_powers.append(np.mean(segment ** 2))
-mean_power = np.mean(combined_powers)
-std_power = np.std(combined_powers)
-if std_power < 1e-12:
-    std_power = 1e-12
-print(f"Baseline: mean={mean_power:.6e}, std={std_power:.6e}")
+def window_power_batches():
+    # Windows flagged as artifacts are dropped here, before normalisation and mapping
+    global n_rejected
+    # Only the mean square is used, so no bands: the spectral engine is skipped
+    for batch in iter_features(recording, window_size, {}, BLOCK_SAMPLES, FEATURE_INDEX, hop, artifacts,
+                               CHANNELS):
+        n_rejected += int(np.count_nonzero(batch.bad))
+        batch = batch.clean()
+        yield batch.starts, batch.power(CHANNELS)
 
-# --- MAIN LOOP ---
-start_time = time.time()
-for i in range(0, len(eeg) - window_size, window_size):
-    chunk = eeg.iloc[i:i + window_size][CHANNELS].values
-    power = np.mean(chunk ** 2)
+# --- BASELINE STATS ---
+normalizer = OnlineNormalizer(forgetting=BASELINE_FORGETTING, warmup=BASELINE_WARMUP)
+if BASELINE == "two-pass":
+    # Global stats over the whole file before playing (only one value per window is kept)
+    batches = list(window_power_batches())
+    for _, powers in batches:
+        normalizer.fit(powers)
+    print(f"Baseline: mean={normalizer.mean:.6e}, std={normalizer.std:.6e}")
+elif BASELINE == "online":
+    # Each window updates the running stats, so playback starts immediately
+    batches = window_power_batches()
+else:
+    raise ValueError(f"Unknown BASELINE mode: {BASELINE!r}")
 
-    # Normalize power
-    z = (power - mean_power) / std_power
-    scaled = np.clip((z * SENSITIVITY + 5), 0, 10)
+# --- OUTPUT: render to .mid or play live ---
+if RENDER_MIDI:
+    sink = MidiFileSink(RENDER_MIDI)
+else:
+    # --- OPEN MIDI PORT (falls back to the first available port) ---
+    outport = open_output(MIDI_PORT)
+    # Notes are handed to the scheduler with their EEG times; it owns the port
+    sink = PlaybackSink(outport)
 
-    # Map to MIDI parameters
-    midi_value = int(np.clip(np.interp(scaled, [0, 10], [0, 127]), 0, 127))
-    note_val = NOTE_RANGE_LOW + (midi_value * (NOTE_RANGE_HIGH - NOTE_RANGE_LOW) // 127)
-    velocity = int(np.clip(np.interp(midi_value, [0, 127],
-                                     [VELOCITY_MIN, VELOCITY_MAX]),
-                           VELOCITY_MIN, VELOCITY_MAX))
+# --- MAIN LOOP ---
+n_windows = 0
+try:
+    for starts, powers in batches:
+        # Normalize power
+        if BASELINE == "online":
+            zs = normalizer.update_many(powers)
+        else:
+            zs = normalizer.zscore(powers)
 
-    # Tempo modulation — faster when more intense
-    window_dynamic = WINDOW_SEC_BASE * np.clip(1.0 - (TEMPO_SCALE * (scaled / 10.0)), 0.3, 1.0)
-    duration = window_dynamic / 2
+        # Map to MIDI parameters
+        notes, velocities, scaled = map_intensity(zs, SENSITIVITY, NOTE_RANGE_LOW, NOTE_RANGE_HIGH,
+                                                  VELOCITY_MIN, VELOCITY_MAX)
 
-    # Send MIDI note
-    outport.send(mido.Message('note_on', note=note_val, velocity=velocity))
-    time.sleep(duration)
-    outport.send(mido.Message('note_off', note=note_val, velocity=velocity))
+        # Tempo modulation — faster when more intense
+        windows_dynamic = dynamic_window(scaled, hop_sec, TEMPO_SCALE)
+        durations = windows_dynamic / 2
 
-    # Align with EEG timing
-    elapsed = time.time() - start_time
-    target_time = (i + window_size) / FS
-    time.sleep(max(0, target_time - elapsed))
+        sink.add(note_events(starts / fs, durations, notes, velocities))
+        for w, i in enumerate(starts):
+            sink.log(i / fs, f"t={i/fs:.2f}s | Power={powers[w]:.6e} | z={zs[w]:.2f} | "
+                             f"Note={notes[w]} | Vel={velocities[w]} | Window={windows_dynamic[w]:.2f}s")
+        n_windows += len(starts)
 
-    print(f"t={i/FS:.2f}s | Power={power:.6e} | z={z:.2f} | "
-          f"Note={note_val} | Vel={velocity} | Window={window_dynamic:.2f}s")
+    print(f"Processed {n_windows} windows from channels: {', '.join(CHANNELS)}")
+    if artifacts is not None:
+        print(f"Skipped {n_rejected} windows as artifacts")
+    if BASELINE == "online":
+        print(f"Final baseline: mean={normalizer.mean:.6e}, std={normalizer.std:.6e}")
+    sink.finish()
+except KeyboardInterrupt:
+    print("Interrupted, releasing notes...")
+finally:
+    sink.close()
@@ -0,0 +1,42 @@
+import numpy as np
+
+from eeg_to_midi.clock import Dejitter
+
+FS = 256.0
+CHUNK = 12
+
+
+def _run(stamps):
+    # Feed (n_chunks, CHUNK) timestamps; dejittered times of every chunk
+    dejitter = Dejitter(FS)
+    return dejitter, np.concatenate([dejitter.update(chunk) for chunk in stamps])
+
+
+def _ideal(n_chunks, start=0):
+    return ((start + np.arange(n_chunks * CHUNK)) / FS).reshape(n_chunks, CHUNK)
+
+
+def test_stalled_chunk_keeps_index():
+    stamps = _ideal(200)
+    stamps[100] += 0.5          # one chunk stamped half a second late
+    dejitter, times = _run(stamps)
+    assert dejitter._next_index == 200 * CHUNK
+    np.testing.assert_allclose(times[101 * CHUNK:], _ideal(99, 101 * CHUNK).ravel(), atol=1e-3)
+
+
+def test_backlog_after_stall_keeps_index():
+    stamps = _ideal(200)
+    # a 0.5 s stall, then the backlog pushed all at once, each chunk stamped on arrival
+    stamps[100:111] = np.maximum(stamps[100:111], stamps[110, -1] - (CHUNK - 1 - np.arange(CHUNK)) / FS)
+    dejitter, times = _run(stamps)
+    assert dejitter._next_index == 200 * CHUNK
+    # the tail of the backlog is late by less than GAP_SEC and counts as jitter, so allow a few ms
+    np.testing.assert_allclose(times[111 * CHUNK:], _ideal(89, 111 * CHUNK).ravel(), atol=0.01)
+
+
+def test_lost_samples_skip_index():
+    stamps = _ideal(200)
+    stamps[100:] += 0.25        # 64 samples never arrived
+    dejitter, times = _run(stamps)
+    assert dejitter._next_index == 200 * CHUNK + 64
+    np.testing.assert_allclose(times[110 * CHUNK:], stamps[110:].ravel(), atol=1e-3)
@@ -0,0 +1,17 @@
+import numpy as np
+
+from eeg_to_midi.features import load_features
+from eeg_to_midi.recording import Recording
+
+
+def test_features_of_requested_channels(tmp_path):
+    path = tmp_path / "rec.xdf"
+    path.write_bytes(b"x")
+    data = np.random.default_rng(0).standard_normal((256 * 10, 4)).astype(np.float32)
+    recording = Recording(path, 256, ["AF7", "AF8", "TP9", "TP10"], data)
+    full = load_features(recording, 256, {'alpha': (8, 12)})
+    for _ in range(2):      # computed, then read back from the index
+        some = load_features(recording, 256, {'alpha': (8, 12)}, channels=["TP9"])
+        assert some.channels == ["TP9"]
+        np.testing.assert_allclose(some.bands("TP9"), full.bands("TP9"))
+    assert len(list((tmp_path / "rec.xdf.features").glob("*.npz"))) == 2
@@ -0,0 +1,37 @@
+import time
+
+import mido
+
+from eeg_to_midi.midi import AsyncMidiOut
+
+
+class SlowPort:
+    name = "slow"
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = []
+
+    def send(self, msg):
+        time.sleep(self.delay)
+        self.sent.append(msg)
+
+    def close(self):
+        pass
+
+
+def test_close_drops_queue_after_timeout():
+    port = SlowPort(0.01)
+    out = AsyncMidiOut(port, max_rate=None)
+    for note in range(100):
+        out.send(mido.Message('note_on', note=note, velocity=100))
+    for note in range(100):
+        out.send(mido.Message('note_off', note=note))
+    t0 = time.perf_counter()
+    out.close(timeout=0.2)
+    elapsed = time.perf_counter() - t0
+    offs = [m for m in port.sent if m.type == 'note_off']
+    assert len(offs) == 100                 # every note-off still goes out
+    assert len(port.sent) < 150             # most note-ons were dropped
+    assert elapsed < 0.2 + 100 * 0.01 + 0.5
+    assert out.stats()[0]['dropped'] == 200 - len(port.sent)
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from eeg_to_midi.recording import open_recording
+
+
+def _write_muse_csv(path, n=3000):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'Time': np.arange(n) / 256.0,
+                       'AF7': rng.standard_normal(n).astype(np.float32),
+                       'AF8': rng.standard_normal(n).astype(np.float32),
+                       'Marker': ['x'] * n,
+                       'Elements': [''] * n})
+    df.loc[2500, 'Elements'] = '/muse/elements/blink'
+    df.to_csv(path, index=False)
+    return df
+
+
+def test_csv_with_text_columns(tmp_path):
+    path = tmp_path / "rec.csv"
+    df = _write_muse_csv(path)
+    for _ in range(2):     # first run streams the CSV and writes the cache, second reads the cache
+        recording = open_recording(path)
+        assert recording.fs == 256
+        assert "Marker" not in recording.channels
+        blocks = np.concatenate(list(recording.iter_blocks(["AF8", "AF7"], block_samples=1000)))
+        np.testing.assert_array_equal(blocks, df[["AF8", "AF7"]].to_numpy(dtype=np.float32))
+    assert (tmp_path / "rec.csv.cache.f32").exists()
+
+
+def test_csv_without_cache_reads_requested_channels(tmp_path):
+    path = tmp_path / "rec.csv"
+    df = _write_muse_csv(path)
+    recording = open_recording(path, use_cache=False)
+    blocks = np.concatenate(list(recording.iter_blocks(["AF7"], block_samples=1000)))
+    np.testing.assert_array_equal(blocks[:, 0], df["AF7"].to_numpy(dtype=np.float32))
+    assert not (tmp_path / "rec.csv.cache.f32").exists()
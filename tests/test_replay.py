@@ -0,0 +1,21 @@
+import numpy as np
+
+from eeg_to_midi.replay import chunk_schedule
+
+
+def test_schedule_follows_timestamps():
+    fs = 256.0
+    # 12-sample packets stamped together, with a 0.5 s gap after the third
+    arrivals = [0.05, 0.1, 0.15, 0.65, 0.7]
+    ts = np.concatenate([a - np.arange(12)[::-1] / fs for a in arrivals])
+    bounds, offsets, duration = chunk_schedule(len(ts), fs, 12, ts)
+    np.testing.assert_array_equal(bounds, np.arange(6) * 12)
+    np.testing.assert_allclose(offsets, np.array(arrivals) - ts[0])
+    assert abs(duration - (ts[-1] - ts[0] + 1 / fs)) < 1e-12
+
+
+def test_schedule_nominal():
+    bounds, offsets, duration = chunk_schedule(50, 256.0, 12)
+    np.testing.assert_array_equal(bounds, [0, 12, 24, 36, 48])
+    np.testing.assert_allclose(offsets, np.arange(4) * 12 / 256.0)
+    assert duration == 48 / 256.0